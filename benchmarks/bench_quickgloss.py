@@ -0,0 +1,318 @@
+"""Offline benchmark suite for QuickGloss
+
+Builds a synthetic lexicon and corpus, times each stage of segmentation,
+manual glossing and transcription separately and reports throughput and
+p50/p99 latency. Results can be saved as a JSON baseline, and a later run
+compared against it fails when a benchmark regresses past the threshold.
+
+    python benchmarks/bench_quickgloss.py --size small --save-baseline baseline.json
+    python benchmarks/bench_quickgloss.py --size small --compare baseline.json --threshold 0.25
+
+Everything runs offline: spaCy uses a blank English pipeline unless
+--real-spacy is given, and Whisper is replaced by a stub model.
+"""
+import argparse
+import io
+import itertools
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import wave
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import spacy
+
+import quickGloss
+
+SIZES = {
+    'small': {'morphemes': 1000, 'tokens': 10000},
+    'medium': {'morphemes': 10000, 'tokens': 30000},
+    'large': {'morphemes': 100000, 'tokens': 100000}
+}
+
+LETTERS = 'abdeghiklmnoprstuwy'
+AFFIX_FEATURES = [
+    'number=plural', 'number=singular', 'case=genitive', 'case=locative', 'case=accusative',
+    'tense=past', 'tense=future', 'aspect=progressive', 'aspect=perfective', 'mood=subjunctive',
+    'polarity=negative', 'person=third'
+]
+SENTENCE_LENGTH = 12
+# process_manual_glossing compiles the whole corpus breakdown on every call, so it is timed on a sample
+MANUAL_GLOSS_SAMPLE = 50
+
+def random_form(rng, min_length, max_length):
+    return ''.join(rng.choice(LETTERS) for _ in range(rng.randint(min_length, max_length)))
+
+def build_lexicon(size, seed=0):
+    """Synthetic lexicon text plus its prefixes, roots and suffixes: roughly 10% prefixes, 20% suffixes, 70% roots"""
+    rng = random.Random(seed)
+    prefixes, roots, suffixes = {}, {}, {}
+
+    while len(prefixes) + len(roots) + len(suffixes) < size:
+        kind = rng.random()
+        if kind < 0.1:
+            prefixes.setdefault(random_form(rng, 1, 3), rng.choice(AFFIX_FEATURES))
+        elif kind < 0.3:
+            suffixes.setdefault(random_form(rng, 1, 4), rng.choice(AFFIX_FEATURES))
+        else:
+            roots.setdefault(random_form(rng, 3, 8), f'meaning=w{len(roots)}')
+
+    lines = [f'{form}-: type=prefix, {features}' for form, features in prefixes.items()]
+    lines += [f'{form}: type=root, {features}' for form, features in roots.items()]
+    lines += [f'-{form}: type=suffix, {features}' for form, features in suffixes.items()]
+    rng.shuffle(lines)
+
+    return '\n'.join(lines), list(prefixes), list(roots), list(suffixes)
+
+def build_corpus(tokens, prefixes, roots, suffixes, seed=0):
+    """Synthetic sentences of prefix*-root-suffix* words with Zipfian root frequencies and ~10% unknown roots"""
+    rng = random.Random(seed)
+    cumulative = list(itertools.accumulate(1.0 / rank for rank in range(1, len(roots) + 1)))
+    known_roots = rng.choices(roots, cum_weights=cumulative, k=tokens)
+    words = []
+
+    for known_root in known_roots:
+        root = random_form(rng, 3, 8) if rng.random() < 0.1 else known_root
+        word = ''.join(rng.choice(prefixes) for _ in range(rng.randint(0, 1))) if prefixes else ''
+        word += root
+        word += ''.join(rng.choice(suffixes) for _ in range(rng.randint(0, 2))) if suffixes else ''
+        words.append(word)
+
+    return [' '.join(words[i:i + SENTENCE_LENGTH]) + '.' for i in range(0, len(words), SENTENCE_LENGTH)]
+
+def build_word_breakdown(sentences, seed=0):
+    """Manual glossing breakdown lines for every distinct word in the corpus"""
+    rng = random.Random(seed)
+    lines = {}
+    for sentence in sentences:
+        for word in sentence.rstrip('.').split():
+            if word not in lines:
+                lines[word] = f'{word}: root={word[:4]}, suffix={word[4:] or "s"}, {rng.choice(AFFIX_FEATURES)}'
+    return '\n'.join(lines.values())
+
+def make_wav(seconds, seed=0):
+    """In-memory 16 kHz mono WAV of low noise; the seed changes the bytes and so the cache key"""
+    samples = (np.random.default_rng(seed).standard_normal(int(seconds * quickGloss.SAMPLE_RATE)) * 300).astype('int16')
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(quickGloss.SAMPLE_RATE)
+        wav_file.writeframes(samples.tobytes())
+    return buffer.getvalue()
+
+class StubSegment:
+    def __init__(self, start, end, text):
+        self.start = start
+        self.end = end
+        self.text = text
+
+class StubInfo:
+    def __init__(self, duration):
+        self.duration = duration
+        self.language = 'en'
+
+class StubWhisperModel:
+    """Stands in for faster-whisper: yields one segment per 5 seconds of audio without decoding"""
+
+    def transcribe(self, audio, beam_size=5, **kwargs):
+        duration = len(audio) / quickGloss.SAMPLE_RATE
+
+        def segments():
+            start = 0.0
+            while start < duration:
+                end = min(start + 5.0, duration)
+                yield StubSegment(start, end, f' segment {int(start)}')
+                start = end
+
+        return segments(), StubInfo(duration)
+
+def summarize(latencies, items):
+    """Latency percentiles in milliseconds and throughput in items per second"""
+    latencies = sorted(latencies)
+    total = sum(latencies)
+    return {
+        'iterations': len(latencies),
+        'p50_ms': round(latencies[len(latencies) // 2] * 1000, 4),
+        'p99_ms': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000, 4),
+        'throughput': round(items / total, 2) if total else float('inf')
+    }
+
+def measure(run, items, iterations):
+    """Call run() repeatedly; each call processes items units of work"""
+    latencies = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        run()
+        latencies.append(time.perf_counter() - started)
+    return summarize(latencies, items * iterations)
+
+def measure_each(run, inputs, items_per_input, warmup, reset=None):
+    """Call run(item) once per input after one untimed warm-up call on an input that isn't measured; reset() then empties the caches the warm-up filled"""
+    run(warmup)
+    if reset is not None:
+        reset()
+    latencies = []
+    for item in inputs:
+        started = time.perf_counter()
+        run(item)
+        latencies.append(time.perf_counter() - started)
+    return summarize(latencies, items_per_input * len(latencies))
+
+def setup_models(real_spacy):
+    """Point QuickGloss at offline models"""
+    if not real_spacy:
+        nlp = spacy.blank('en')
+        for model_name in set(quickGloss.SPACY_MODEL_NAMES.values()):
+            quickGloss.SPACY_MODELS.put(model_name, nlp)
+
+    quickGloss.create_whisper_model = StubWhisperModel
+    reset_transcription_cache()
+
+def reset_word_cache():
+    """Start segmentation from an empty per-word cache, as a fresh worker does"""
+    quickGloss.WORD_CACHE = quickGloss.LRUCache(quickGloss.WORD_CACHE_SIZE)
+
+def reset_transcription_cache():
+    """Point the transcription cache at a new empty directory"""
+    quickGloss.TRANSCRIPTION_CACHE_DIR = tempfile.mkdtemp(prefix='quickgloss_bench_')
+
+def run_benchmarks(size, iterations, real_spacy=False, seed=0):
+    setup_models(real_spacy)
+    config = SIZES[size]
+    lexicon_text, prefixes, roots, suffixes = build_lexicon(config['morphemes'], seed)
+    sentences = build_corpus(config['tokens'], prefixes, roots, suffixes, seed)
+    words = [word for sentence in sentences for word in sentence.rstrip('.').split()]
+    # warm-ups run on a sentence outside the corpus so that no measured input is cached by them
+    warmup = build_corpus(SENTENCE_LENGTH, prefixes, roots, suffixes, seed + 1)[0]
+    word_breakdown = build_word_breakdown(sentences, seed)
+    abbreviations = quickGloss.get_gloss_renderer('').abbreviations
+
+    lexicon = quickGloss.register_lexicon(lexicon_text)
+    nlp = quickGloss.get_spacy_model('en')
+    client = quickGloss.app.test_client()
+    results = {}
+
+    results['parse_morpheme_data'] = dict(
+        measure(lambda: quickGloss.parse_morpheme_data(lexicon_text), config['morphemes'], iterations),
+        unit='morphemes/s'
+    )
+
+    def find_all():
+        for word in words:
+            quickGloss.find_morpheme_boundaries(word, lexicon)
+    results['find_morpheme_boundaries'] = dict(measure(find_all, len(words), iterations), unit='words/s')
+
+    def segment_sentence(sentence):
+        context = quickGloss.build_analysis_context(sentence, lexicon, nlp, 'en')
+        quickGloss.segment_morphemes(context, include_translation=True)
+    quickGloss.get_gloss_predictor(lexicon)
+    results['segment_morphemes'] = dict(
+        measure_each(segment_sentence, sentences, SENTENCE_LENGTH, warmup, reset_word_cache),
+        unit='tokens/s'
+    )
+
+    results['process_manual_glossing'] = dict(
+        measure_each(lambda sentence: quickGloss.process_manual_glossing(sentence, word_breakdown, abbreviations), sentences[:MANUAL_GLOSS_SAMPLE], SENTENCE_LENGTH, warmup),
+        unit='tokens/s'
+    )
+
+    def post_segment(sentence):
+        response = client.post('/segment', json={'text': sentence, 'lexicon_id': lexicon['id'], 'include_translation': True})
+        assert 'error' not in response.get_json(), response.get_json()
+    results['endpoint_segment'] = dict(measure_each(post_segment, sentences, SENTENCE_LENGTH, warmup, reset_word_cache), unit='tokens/s')
+
+    def post_manual_gloss(sentence):
+        response = client.post('/manual_gloss', json={'text': sentence, 'word_breakdown': word_breakdown})
+        assert 'error' not in response.get_json(), response.get_json()
+    results['endpoint_manual_gloss'] = dict(measure_each(post_manual_gloss, sentences, SENTENCE_LENGTH, warmup), unit='tokens/s')
+
+    audio_seconds = 60
+    recordings = [make_wav(audio_seconds, seed + i) for i in range(iterations)]
+    warmup_recording = make_wav(audio_seconds, seed + iterations)
+
+    def post_transcribe(audio):
+        response = client.post('/transcribe', data={'file': (io.BytesIO(audio), 'bench.wav')})
+        assert response.get_json()['success'], response.get_json()
+    results['endpoint_transcribe'] = dict(
+        measure_each(post_transcribe, recordings, audio_seconds, warmup_recording, reset_transcription_cache),
+        unit='audio s/s'
+    )
+    # every recording is cached by the uncached run above
+    results['endpoint_transcribe_cached'] = dict(measure_each(post_transcribe, recordings, audio_seconds, recordings[0]), unit='audio s/s')
+
+    return {
+        'meta': {
+            'size': size,
+            'morphemes': config['morphemes'],
+            'tokens': len(words),
+            'sentences': len(sentences),
+            'spacy': 'installed models' if real_spacy else 'blank en',
+            'python': platform.python_version(),
+            'machine': platform.machine()
+        },
+        'results': results
+    }
+
+def compare(report, baseline, threshold):
+    """Return the benchmarks whose p50 latency is more than threshold slower than the baseline"""
+    regressions = []
+    if baseline['meta'].get('size') != report['meta']['size']:
+        print(f"warning: baseline size {baseline['meta'].get('size')} differs from this run ({report['meta']['size']})")
+
+    for name, result in report['results'].items():
+        previous = baseline['results'].get(name)
+        if not previous or not previous['p50_ms']:
+            continue
+        change = result['p50_ms'] / previous['p50_ms'] - 1
+        if change > threshold:
+            regressions.append((name, previous['p50_ms'], result['p50_ms'], change))
+
+    return regressions
+
+def print_report(report):
+    print(f"QuickGloss benchmarks ({report['meta']['size']}: {report['meta']['morphemes']} morphemes, "
+          f"{report['meta']['tokens']} tokens, spaCy {report['meta']['spacy']})")
+    print(f"{'benchmark':<28}{'p50 ms':>12}{'p99 ms':>12}{'throughput':>16}  unit")
+    for name, result in report['results'].items():
+        print(f"{name:<28}{result['p50_ms']:>12.3f}{result['p99_ms']:>12.3f}{result['throughput']:>16.1f}  {result['unit']}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--size', choices=sorted(SIZES), default='small')
+    parser.add_argument('--iterations', type=int, default=5, help='repetitions of the whole-lexicon and whole-corpus benchmarks')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--real-spacy', action='store_true', help='use installed spaCy models instead of a blank pipeline')
+    parser.add_argument('--save-baseline', metavar='PATH', help='write the results to a JSON baseline')
+    parser.add_argument('--compare', metavar='PATH', help='compare against a JSON baseline and fail on regressions')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed p50 slowdown before failing, as a fraction (default 0.25)')
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(args.size, args.iterations, args.real_spacy, args.seed)
+    print_report(report)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as baseline_file:
+            json.dump(report, baseline_file, indent=2)
+        print(f"baseline saved to {args.save_baseline}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare(report, baseline, args.threshold)
+        for name, before, after, change in regressions:
+            print(f"REGRESSION {name}: p50 {before:.3f} ms -> {after:.3f} ms (+{change:.0%})")
+        if regressions:
+            return 1
+        print(f"no regressions beyond {args.threshold:.0%}")
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,67 @@
+"""Import-time regression check for QuickGloss
+
+Imports quickGloss in a fresh interpreter, serves `/` and `/manual_gloss`
+through the test client and fails when that takes longer than the limit or
+when any heavy library (spaCy, scikit-learn, faster-whisper, ...) was
+imported along the way.
+
+    python benchmarks/check_import_time.py --max-seconds 1.0
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import quickGloss
+imported = time.perf_counter()
+client = quickGloss.app.test_client()
+index = client.get('/')
+gloss = client.post('/manual_gloss', json={'text': 'dogs ran', 'word_breakdown': 'dog-s run'})
+served = time.perf_counter()
+print(json.dumps({
+    'import_seconds': imported - started,
+    'first_response_seconds': served - started,
+    'statuses': [index.status_code, gloss.status_code],
+    'gloss_error': gloss.get_json().get('error'),
+    'heavy_modules': sorted({name.split('.')[0] for name in sys.modules} & {name.split('.')[0] for name in quickGloss.HEAVY_MODULES}),
+}))
+"""
+
+def probe():
+    """Run the probe in a fresh interpreter so nothing is imported yet"""
+    output = subprocess.run([sys.executable, '-c', PROBE], cwd=ROOT, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--max-seconds', type=float, default=1.0, help='allowed time from interpreter start of the import to the /manual_gloss response (default 1.0)')
+    parser.add_argument('--runs', type=int, default=3, help='probes to run; the fastest one is checked (default 3)')
+    args = parser.parse_args(argv)
+
+    results = [probe() for _ in range(args.runs)]
+    best = min(results, key=lambda result: result['first_response_seconds'])
+    print(f"import {best['import_seconds'] * 1000:.1f} ms, first /manual_gloss response {best['first_response_seconds'] * 1000:.1f} ms")
+
+    failures = []
+    if best['statuses'] != [200, 200] or best['gloss_error']:
+        failures.append(f"requests failed: {best['statuses']} {best['gloss_error'] or ''}".strip())
+    if best['heavy_modules']:
+        failures.append(f"heavy modules imported: {', '.join(best['heavy_modules'])}")
+    if best['first_response_seconds'] > args.max_seconds:
+        failures.append(f"took {best['first_response_seconds']:.3f} s, limit is {args.max_seconds:.3f} s")
+
+    for failure in failures:
+        print(f"FAIL {failure}")
+    if failures:
+        return 1
+    print("ok")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,139 @@
+"""Segmentation lattice correctness check for QuickGloss
+
+Compares the n best analyses from `segment_lattice` with a brute-force
+enumeration of every prefix*/root/suffix* analysis (with optional infix and
+circumfix) on fixed and random lexicons, and fails when the top-n scores
+differ or an analysis doesn't score what its segments are worth.
+
+    python benchmarks/check_lattice.py --words 300
+"""
+import argparse
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import quickGloss
+
+# the lexicon and words from the pruning bug, where a later prefix path failing the
+# bound used to skip every remaining root end
+FIXED_LEXICON = "a-:\nn-:\nan-:\nna-:\n-e:\n-s:\n-es:\n-se:\n-x:\n-ex:\nz:"
+FIXED_CASES = [('naannaqs', 8), ('ananssxzas', 6)]
+
+def morpheme_score(length, morpheme_length):
+    """What one affix adds to an analysis of a word of the given length"""
+    return (quickGloss.LATTICE_COVERAGE_WEIGHT * morpheme_length - quickGloss.LATTICE_MORPHEME_PENALTY) / length
+
+def root_score(length, known):
+    """What the root adds to an analysis of a word of the given length"""
+    return (quickGloss.LATTICE_KNOWN_ROOT_WEIGHT if known else 0.0) - quickGloss.LATTICE_MORPHEME_PENALTY / length
+
+def segments_score(word, segments, lexicon):
+    """Score an analysis from its segments alone"""
+    length = len(word)
+    score = 0.0
+    for segment in segments:
+        if segment['type'] == 'root':
+            score += root_score(length, segment['morpheme'].lower() in lexicon['root_index'])
+        elif segment['type'] == 'circumfix':
+            # both parts together are one morpheme
+            if segment['part'] == 'prefix':
+                score -= quickGloss.LATTICE_MORPHEME_PENALTY / length
+            score += quickGloss.LATTICE_COVERAGE_WEIGHT * len(segment['morpheme']) / length
+        else:
+            score += morpheme_score(length, len(segment['morpheme']))
+    return score
+
+def chains(word, start, stop, affixes):
+    """Every sequence of affixes covering word[start:stop] exactly"""
+    if start == stop:
+        yield []
+        return
+    for affix in affixes:
+        if word.startswith(affix, start) and start + len(affix) <= stop:
+            for rest in chains(word, start + len(affix), stop, affixes):
+                yield [affix] + rest
+
+def brute_force(word, lexicon):
+    """Scores of every analysis the lexicon allows, best first"""
+    length = len(word)
+    prefixes = [prefix.lower() for prefix in lexicon['prefixes']]
+    suffixes = [suffix.lower() for suffix in lexicon['suffixes']]
+    infixes = [infix.lower() for infix in lexicon['infixes']]
+
+    regions = [(0, length, 0.0)]
+    for circumfix in lexicon['circumfixes']:
+        prefix_part, suffix_part = circumfix.lower().split('...', 1)
+        if word.startswith(prefix_part) and word.endswith(suffix_part) and len(prefix_part) < length - len(suffix_part):
+            regions.append((len(prefix_part), length - len(suffix_part), morpheme_score(length, len(prefix_part) + len(suffix_part))))
+
+    scores = []
+    for lo, hi, outer in regions:
+        for root_start in range(lo, hi):
+            for root_end in range(root_start + 1, hi + 1):
+                for prefix_chain in chains(word, lo, root_start, prefixes):
+                    for suffix_chain in chains(word, root_end, hi, suffixes):
+                        affixes = outer + sum(morpheme_score(length, len(affix)) for affix in prefix_chain + suffix_chain)
+                        known = word[root_start:root_end] in lexicon['root_index']
+                        scores.append(affixes + root_score(length, known))
+                        for infix in infixes:
+                            for infix_start in range(root_start + 1, root_end - len(infix)):
+                                infix_end = infix_start + len(infix)
+                                if word.startswith(infix, infix_start) and word[root_start:infix_start] + word[infix_end:root_end] in lexicon['root_index']:
+                                    scores.append(affixes + root_score(length, True) + morpheme_score(length, len(infix)))
+    return sorted(scores, reverse=True)
+
+def random_lexicon(rng, alphabet):
+    """A small random lexicon over a tiny alphabet, so affixes overlap a lot"""
+    def form(low, high):
+        return ''.join(rng.choice(alphabet) for _ in range(rng.randint(low, high)))
+    lines = [f'{form(1, 2)}-: polarity=negative' for _ in range(rng.randint(1, 5))]
+    lines += [f'-{form(1, 2)}: number=plural' for _ in range(rng.randint(1, 5))]
+    lines += [f'{form(1, 3)}: meaning=root{index}' for index in range(rng.randint(1, 4))]
+    if rng.random() < 0.5:
+        lines.append(f'<{form(1, 2)}>: aspect=perfective')
+    if rng.random() < 0.5:
+        lines.append(f'{form(1, 2)}-...-{form(1, 2)}: type=circumfix, aspect=perfective')
+    return '\n'.join(lines)
+
+def check(word, lexicon, n):
+    """Problems found comparing the lattice with brute force for one word"""
+    analyses = quickGloss.segment_lattice(word, lexicon, n)
+    expected = [round(score, 9) for score in brute_force(word, lexicon)[:n]]
+    actual = [round(analysis['score'], 9) for analysis in analyses]
+    problems = []
+    if actual != expected:
+        problems.append(f'{word!r} n={n}: lattice {actual}, brute force {expected}')
+    for analysis in analyses:
+        if round(segments_score(word, analysis['segments'], lexicon), 9) != round(analysis['score'], 9):
+            problems.append(f'{word!r}: {quickGloss.render_segments(analysis["segments"])} scored {analysis["score"]}')
+    return problems
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--words', type=int, default=300, help='random words to check')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    problems = []
+    fixed = quickGloss.compile_lexicon(quickGloss.parse_morpheme_data(FIXED_LEXICON))
+    for word, n in FIXED_CASES:
+        problems.extend(check(word, fixed, n))
+
+    rng = random.Random(args.seed)
+    alphabet = 'ans'
+    for _ in range(args.words):
+        lexicon = quickGloss.compile_lexicon(quickGloss.parse_morpheme_data(random_lexicon(rng, alphabet)))
+        word = ''.join(rng.choice(alphabet) for _ in range(rng.randint(1, 10)))
+        problems.extend(check(word, lexicon, rng.randint(1, 8)))
+
+    for problem in problems[:20]:
+        print(problem)
+    if problems:
+        print(f'FAIL: {len(problems)} mismatches')
+        sys.exit(1)
+    print('ok')
+
+if __name__ == '__main__':
+    main()
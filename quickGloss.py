@@ -1,63 +1,517 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, Request, Response, request, jsonify, render_template, g, has_request_context
 from flask_cors import CORS
-import spacy
 import re
-import langdetect
-from sklearn.metrics.pairwise import cosine_similarity
-from faster_whisper import WhisperModel
+import json
 import tempfile
 from werkzeug.utils import secure_filename
+from werkzeug.exceptions import RequestEntityTooLarge
 import os
+import io
+import sys
+import gzip
+import hashlib
+import threading
+import time
+import uuid
+import queue
+import multiprocessing
+import gc
+import heapq
+import sqlite3
+import importlib
+import argparse
+from collections import Counter, OrderedDict, deque
+from types import MappingProxyType
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+
+# uploads stay in memory up to this size before spilling to disk, and are refused above the limit
+UPLOAD_SPOOL_MB = int(os.environ.get('QUICKGLOSS_UPLOAD_SPOOL_MB', 64))
+MAX_UPLOAD_MB = int(os.environ.get('QUICKGLOSS_MAX_UPLOAD_MB', 1024))
+
+class QuickGlossRequest(Request):
+    """Request that buffers file uploads in a spooled file, only spilling to disk above UPLOAD_SPOOL_MB"""
+    
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_MB * 1024 * 1024)
 
 app = Flask(__name__)
+app.request_class = QuickGlossRequest
+# werkzeug enforces this while the body streams in, so oversized uploads are rejected early
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_MB * 1024 * 1024
 CORS(app)
 
-SPACY_MODELS = {}
 AVAILABLE_LANGUAGES = ['en', 'de', 'es', 'fr', 'it', 'pt', 'nl', 'ru', 'zh', 'ja', 'id']
 
-def load_spacy_models():
-    """Load available SpaCy models"""
-    global SPACY_MODELS
-    model_map = {
-        'en': 'en_core_web_sm',
-        'de': 'de_core_news_sm',
-        'es': 'es_core_news_sm',
-        'fr': 'fr_core_news_sm',
-        'it': 'it_core_news_sm',
-        'pt': 'pt_core_news_sm',
-        'nl': 'nl_core_news_sm',
-        'ru': 'ru_core_news_sm',
-        'zh': 'zh_core_web_sm',
-        'ja': 'ja_core_news_sm',
-        'id': 'id_core_news_sm'
-    }
+# unknown morphemes get gloss candidates from character n-gram similarity to the lexicon
+PREDICTION_TOP_K = int(os.environ.get('QUICKGLOSS_PREDICTION_TOP_K', 3))
+PREDICTION_MIN_CONFIDENCE = float(os.environ.get('QUICKGLOSS_PREDICTION_MIN_CONFIDENCE', 0.5))
+PREDICTION_NGRAM_RANGE = (2, 4)
+
+# language detection is seeded and cached by text hash; a project keeps the first language found for it in the project store
+LANGUAGE_DETECT_SEED = 0
+LANGUAGE_CACHE_SIZE = int(os.environ.get('QUICKGLOSS_LANGUAGE_CACHE_SIZE', 10000))
+
+# words are segmented by ranking every prefix*/root/suffix* analysis the lexicon allows; affix
+# coverage and the per-morpheme penalty are both scaled by word length, so that an affix is
+# worth splitting off however long the word is
+LATTICE_KNOWN_ROOT_WEIGHT = 2.0
+LATTICE_COVERAGE_WEIGHT = 1.0
+LATTICE_MORPHEME_PENALTY = 0.05
+LATTICE_PREDICTION_WEIGHT = 1.0
+MAX_N_BEST = 10
+
+# uploaded lexicons are kept parsed in memory, bounded by count and approximate size
+LEXICON_CACHE_SIZE = int(os.environ.get('QUICKGLOSS_LEXICON_CACHE_SIZE', 64))
+LEXICON_CACHE_MB = int(os.environ.get('QUICKGLOSS_LEXICON_CACHE_MB', 256))
+
+# segmentations of individual word forms are memoized per lexicon
+WORD_CACHE_SIZE = int(os.environ.get('QUICKGLOSS_WORD_CACHE_SIZE', 50000))
+
+# limits for /segment_batch
+SEGMENT_BATCH_MAX_TEXTS = int(os.environ.get('QUICKGLOSS_SEGMENT_BATCH_MAX_TEXTS', 10000))
+SEGMENT_BATCH_SIZE = int(os.environ.get('QUICKGLOSS_SEGMENT_BATCH_SIZE', 64))
+
+# spaCy models load on first use; idle ones are dropped when over this budget (0 = no limit)
+SPACY_MEMORY_MB = int(os.environ.get('QUICKGLOSS_SPACY_MEMORY_MB', 0))
+
+# Whisper models are loaded on first transcription; a pool of them lets uploads run in parallel
+WHISPER_MODEL_SIZE = os.environ.get('QUICKGLOSS_WHISPER_MODEL', 'base')
+WHISPER_DEVICE = os.environ.get('QUICKGLOSS_WHISPER_DEVICE', 'cpu')
+WHISPER_COMPUTE_TYPE = os.environ.get('QUICKGLOSS_WHISPER_COMPUTE_TYPE', 'int8')
+WHISPER_CPU_THREADS = int(os.environ.get('QUICKGLOSS_WHISPER_CPU_THREADS', 0))
+WHISPER_NUM_WORKERS = int(os.environ.get('QUICKGLOSS_WHISPER_NUM_WORKERS', 1))
+WHISPER_POOL_SIZE = int(os.environ.get('QUICKGLOSS_WHISPER_POOL_SIZE', 1))
+DEFAULT_BEAM_SIZE = 5
+MAX_BEAM_SIZE = 10
+
+# long recordings are split at silences and decoded in parallel worker processes
+LONG_AUDIO_PROCESSES = int(os.environ.get('QUICKGLOSS_LONG_AUDIO_PROCESSES', os.cpu_count() or 1))
+LONG_AUDIO_THREADS = int(os.environ.get('QUICKGLOSS_LONG_AUDIO_THREADS', 1))
+LONG_AUDIO_CHUNK_SECONDS = float(os.environ.get('QUICKGLOSS_LONG_AUDIO_CHUNK_SECONDS', 60))
+LONG_AUDIO_MIN_SILENCE_MS = int(os.environ.get('QUICKGLOSS_LONG_AUDIO_MIN_SILENCE_MS', 500))
+SAMPLE_RATE = 16000
+
+# production serving: models are preloaded in the parent and shared copy-on-write by forked workers
+SERVER_HOST = os.environ.get('QUICKGLOSS_HOST', '0.0.0.0')
+SERVER_PORT = int(os.environ.get('QUICKGLOSS_PORT', 5000))
+SERVER_WORKERS = int(os.environ.get('QUICKGLOSS_WORKERS', 2))
+SERVER_THREADS = int(os.environ.get('QUICKGLOSS_THREADS', 4))
+PRELOAD_LANGUAGES = [lang for lang in os.environ.get('QUICKGLOSS_PRELOAD_LANGUAGES', ','.join(AVAILABLE_LANGUAGES)).split(',') if lang]
+PRELOAD_WHISPER = os.environ.get('QUICKGLOSS_PRELOAD_WHISPER', '1').lower() not in ('0', 'false', 'no')
+
+# requests slower than this many ms get a sampled profile written as folded stacks (0 = off)
+PROFILE_SLOW_MS = float(os.environ.get('QUICKGLOSS_PROFILE_SLOW_MS', 0))
+PROFILE_INTERVAL_MS = float(os.environ.get('QUICKGLOSS_PROFILE_INTERVAL_MS', 5))
+PROFILE_DIR = os.environ.get('QUICKGLOSS_PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'quickgloss_profiles'))
+
+# finished transcriptions are cached on disk, keyed by the audio bytes and decoding parameters
+TRANSCRIPTION_CACHE_DIR = os.environ.get('QUICKGLOSS_TRANSCRIPTION_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'quickgloss_transcriptions'))
+TRANSCRIPTION_CACHE_MB = int(os.environ.get('QUICKGLOSS_TRANSCRIPTION_CACHE_MB', 512))
+
+# glossed sentences can be kept in a SQLite project store and searched as a concordance
+PROJECT_DB = os.environ.get('QUICKGLOSS_PROJECT_DB', os.path.join(os.path.expanduser('~'), '.quickgloss', 'quickgloss_projects.db'))
+CONCORDANCE_PAGE_SIZE = 50
+CONCORDANCE_MAX_PAGE_SIZE = 500
+STORE_CHUNK_SIZE = 500
+# each word-form pattern costs a substring test per stored word form; past this many, re-gloss everything instead
+RELEXICON_MAX_PATTERNS = 1000
+
+# JSON and text responses at least this large are gzipped for clients that accept it (0 = off)
+COMPRESS_MIN_BYTES = int(os.environ.get('QUICKGLOSS_COMPRESS_MIN_BYTES', 16384))
+COMPRESS_LEVEL = int(os.environ.get('QUICKGLOSS_COMPRESS_LEVEL', 5))
+
+# background transcription jobs
+TRANSCRIBE_WORKERS = int(os.environ.get('QUICKGLOSS_TRANSCRIBE_WORKERS', 2))
+TRANSCRIBE_QUEUE_DEPTH = int(os.environ.get('QUICKGLOSS_TRANSCRIBE_QUEUE_DEPTH', 16))
+TRANSCRIBE_JOB_TTL = int(os.environ.get('QUICKGLOSS_TRANSCRIBE_JOB_TTL', 3600))
+
+def approximate_size(obj):
+    """Roughly estimate the memory held by nested dicts, lists and strings"""
+    total = 0
+    seen = set()
+    stack = [obj]
+    
+    while stack:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        total += sys.getsizeof(item)
+        
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set)):
+            stack.extend(item)
+    
+    return total
+
+class LRUCache:
+    """Thread-safe least-recently-used cache bounded by entry count and, optionally, size in bytes"""
+    
+    def __init__(self, max_entries, max_bytes=None, sizeof=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.entries = OrderedDict()
+        self.sizes = {}
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+    
+    def get(self, key, default=None):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+            return default
+    
+    def put(self, key, value):
+        size = self.sizeof(value) if self.sizeof else 0
+        
+        with self.lock:
+            if key in self.entries:
+                self.total_bytes -= self.sizes.pop(key)
+                del self.entries[key]
+            
+            self.entries[key] = value
+            self.sizes[key] = size
+            self.total_bytes += size
+            self.trim()
+    
+    def resize(self, key):
+        """Re-measure an entry that grew in place, evicting older entries if the cache is now over budget"""
+        with self.lock:
+            value = self.entries.get(key)
+        if value is None or not self.sizeof:
+            return
+        size = self.sizeof(value)
+        
+        with self.lock:
+            if self.entries.get(key) is value:
+                self.total_bytes += size - self.sizes[key]
+                self.sizes[key] = size
+                self.trim()
+    
+    def trim(self):
+        """Evict the oldest entries until the cache is within its bounds; the caller holds the lock"""
+        # always keep the newest entry, even if it alone is over the byte budget
+        while len(self.entries) > 1 and (
+                len(self.entries) > self.max_entries or
+                (self.max_bytes is not None and self.total_bytes > self.max_bytes)):
+            old_key, _ = self.entries.popitem(last=False)
+            self.total_bytes -= self.sizes.pop(old_key)
+            self.evictions += 1
     
-    for lang, model_name in model_map.items():
+    def pop(self, key, default=None):
+        with self.lock:
+            if key not in self.entries:
+                return default
+            self.total_bytes -= self.sizes.pop(key)
+            return self.entries.pop(key)
+    
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.entries
+    
+    def __len__(self):
+        with self.lock:
+            return len(self.entries)
+    
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'bytes': self.total_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+
+METRICS_LOCK = threading.Lock()
+HISTOGRAM_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+HISTOGRAMS = {}
+COUNTERS = {}
+
+def observe(name, labels, value):
+    """Record a value in a Prometheus-style histogram"""
+    key = (name, tuple(sorted(labels.items())))
+    with METRICS_LOCK:
+        histogram = HISTOGRAMS.get(key)
+        if histogram is None:
+            histogram = HISTOGRAMS[key] = {'buckets': [0] * len(HISTOGRAM_BUCKETS), 'sum': 0.0, 'count': 0}
+        for index, bound in enumerate(HISTOGRAM_BUCKETS):
+            if value <= bound:
+                histogram['buckets'][index] += 1
+        histogram['sum'] += value
+        histogram['count'] += 1
+
+def increment(name, labels, amount=1):
+    """Add to a Prometheus-style counter"""
+    key = (name, tuple(sorted(labels.items())))
+    with METRICS_LOCK:
+        COUNTERS[key] = COUNTERS.get(key, 0) + amount
+
+@contextmanager
+def stage(name):
+    """Time one stage of a request for the Server-Timing header and the stage histograms"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        endpoint = 'none'
+        if has_request_context():
+            endpoint = request.endpoint or 'none'
+            timings = g.setdefault('timings', {})
+            timings[name] = timings.get(name, 0.0) + elapsed
+        observe('quickgloss_stage_duration_seconds', {'endpoint': endpoint, 'stage': name}, elapsed)
+
+class StackSampler(threading.Thread):
+    """Samples one thread's stack at a fixed interval, collecting folded stacks for flame graphs"""
+    
+    def __init__(self, thread_id, interval):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+    
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            frames = []
+            while frame is not None:
+                frames.append(f"{frame.f_code.co_name} ({os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_firstlineno})")
+                frame = frame.f_back
+            if frames:
+                self.stacks[';'.join(reversed(frames))] += 1
+    
+    def stop(self):
+        self.stopped.set()
+        self.join()
+    
+    def dump(self, path):
+        with open(path, 'w', encoding='utf-8') as profile_file:
+            for stack, count in self.stacks.most_common():
+                profile_file.write(f'{stack} {count}\n')
+
+SPACY_MODEL_NAMES = {
+    'en': 'en_core_web_sm',
+    'de': 'de_core_news_sm',
+    'es': 'es_core_news_sm',
+    'fr': 'fr_core_news_sm',
+    'it': 'it_core_news_sm',
+    'pt': 'pt_core_news_sm',
+    'nl': 'nl_core_news_sm',
+    'ru': 'ru_core_news_sm',
+    'zh': 'zh_core_web_sm',
+    'ja': 'ja_core_news_sm',
+    'id': 'id_core_news_sm'
+}
+SPACY_FALLBACK_MODEL = 'en_core_web_sm'
+
+# the glosser only reads POS, tags, lemmas, morphology and dependencies
+SPACY_EXCLUDED_PIPES = ['ner', 'entity_ruler', 'entity_linker', 'span_ruler', 'spancat', 'textcat', 'textcat_multilabel']
+
+def spacy_model_size(nlp):
+    """Estimate a loaded model's memory from the size of its data on disk"""
+    path = getattr(nlp, 'path', None)
+    if not path or not os.path.isdir(path):
+        return 0
+    
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+# models are keyed by package name, so languages that fall back to English share one instance
+SPACY_MODELS = LRUCache(len(SPACY_MODEL_NAMES), SPACY_MEMORY_MB * 1024 * 1024 or None, sizeof=spacy_model_size)
+MISSING_SPACY_MODELS = set()
+SPACY_LOAD_LOCK = threading.Lock()
+
+def load_spacy_model(model_name):
+    """Load a SpaCy model by package name on first use, or None if it is not installed"""
+    nlp = SPACY_MODELS.get(model_name)
+    if nlp is not None or model_name in MISSING_SPACY_MODELS:
+        return nlp
+    
+    with SPACY_LOAD_LOCK:
+        # another request may have loaded it while we waited
+        if model_name in SPACY_MODELS:
+            return SPACY_MODELS.get(model_name)
+        
+        import spacy
+        
         try:
-            SPACY_MODELS[lang] = spacy.load(model_name)
+            nlp = spacy.load(model_name, exclude=SPACY_EXCLUDED_PIPES)
         except OSError:
-            # fallback to english
+            MISSING_SPACY_MODELS.add(model_name)
+            return None
+        
+        SPACY_MODELS.put(model_name, nlp)
+        return nlp
+
+def get_spacy_model(language):
+    """Return the SpaCy model for a language, falling back to English"""
+    nlp = None
+    if language in SPACY_MODEL_NAMES:
+        nlp = load_spacy_model(SPACY_MODEL_NAMES[language])
+    if nlp is None:
+        nlp = load_spacy_model(SPACY_FALLBACK_MODEL)
+    return nlp
+
+def load_spacy_models(languages=None):
+    """Load SpaCy models up front instead of on first use"""
+    for lang in languages or AVAILABLE_LANGUAGES:
+        get_spacy_model(lang)
+
+WHISPER_POOL = queue.Queue()
+WHISPER_POOL_LOCK = threading.Lock()
+WHISPER_MODELS_CREATED = 0
+
+def create_whisper_model():
+    """Load one Whisper model with the configured size and threading"""
+    from faster_whisper import WhisperModel
+    
+    print("Loading Whisper model...")
+    model = WhisperModel(
+        WHISPER_MODEL_SIZE,
+        device=WHISPER_DEVICE,
+        compute_type=WHISPER_COMPUTE_TYPE,
+        cpu_threads=WHISPER_CPU_THREADS,
+        num_workers=WHISPER_NUM_WORKERS
+    )
+    print("Model loaded!")
+    return model
+
+@contextmanager
+def whisper_model():
+    """Check a Whisper model out of the pool, loading another one while the pool is below its size"""
+    global WHISPER_MODELS_CREATED
+    
+    try:
+        model = WHISPER_POOL.get_nowait()
+    except queue.Empty:
+        with WHISPER_POOL_LOCK:
+            create = WHISPER_MODELS_CREATED < WHISPER_POOL_SIZE
+            if create:
+                WHISPER_MODELS_CREATED += 1
+        
+        if create:
             try:
-                SPACY_MODELS[lang] = spacy.load('en_core_web_sm')
-            except OSError:
-                SPACY_MODELS[lang] = None
+                model = create_whisper_model()
+            except Exception:
+                with WHISPER_POOL_LOCK:
+                    WHISPER_MODELS_CREATED -= 1
+                raise
+        else:
+            # every model is busy, wait for one to come back
+            model = WHISPER_POOL.get()
+    
+    try:
+        yield model
+    finally:
+        WHISPER_POOL.put(model)
+
+def load_whisper_models():
+    """Fill the Whisper pool up to its size instead of loading models on first transcription"""
+    global WHISPER_MODELS_CREATED
+    
+    while True:
+        with WHISPER_POOL_LOCK:
+            if WHISPER_MODELS_CREATED >= WHISPER_POOL_SIZE:
+                return
+            WHISPER_MODELS_CREATED += 1
+        
+        try:
+            model = create_whisper_model()
+        except Exception:
+            with WHISPER_POOL_LOCK:
+                WHISPER_MODELS_CREATED -= 1
+            raise
+        WHISPER_POOL.put(model)
 
-print("Loading Whisper model...")
-model = WhisperModel("base", device="cpu", compute_type="int8")
-print("Model loaded!")
+def parse_beam_size(value):
+    """Read a per-request beam size, clamped to a sane range; smaller is faster, larger more accurate"""
+    try:
+        beam_size = int(value)
+    except (TypeError, ValueError):
+        return DEFAULT_BEAM_SIZE
+    return max(1, min(beam_size, MAX_BEAM_SIZE))
 
 ALLOWED_EXTENSIONS = {'mp3', 'wav', 'mp4', 'avi', 'mov', 'mkv', 'flac', 'm4a', 'ogg'}
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+LANGUAGE_CACHE = LRUCache(LANGUAGE_CACHE_SIZE)
+
 def detect_language(text):
-    """Detect language of input text"""
+    """Detect language of input text, deterministically and cached by a hash of the text"""
+    key = hashlib.sha256(text.encode('utf-8')).hexdigest()
+    language = LANGUAGE_CACHE.get(key)
+    if language is not None:
+        return language
+    
+    import langdetect
+    
+    # langdetect samples randomly, so unseeded runs can disagree on short or mixed texts
+    langdetect.DetectorFactory.seed = LANGUAGE_DETECT_SEED
     try:
         detected = langdetect.detect(text)
-        return detected if detected in AVAILABLE_LANGUAGES else 'en'
-    except:
-        return 'en'
+        language = detected if detected in AVAILABLE_LANGUAGES else 'en'
+    except langdetect.LangDetectException:
+        language = 'en'
+    
+    LANGUAGE_CACHE.put(key, language)
+    return language
+
+def detect_batch_language(texts, sample_chars=2000):
+    """Detect one language for a whole batch from a sample of its texts"""
+    sample = []
+    length = 0
+    for text in texts:
+        sample.append(text)
+        length += len(text)
+        if length >= sample_chars:
+            break
+    return detect_language(' '.join(sample))
+
+def resolve_language(texts, language=None, project=None):
+    """Pick the language for a request: the client's hint, then the project's sticky language, then detection"""
+    if language in AVAILABLE_LANGUAGES:
+        if project:
+            set_project_language(project, language)
+        return language
+    
+    if project:
+        language = project_language(project)
+        if language is not None:
+            return language
+    
+    language = detect_batch_language(texts)
+    if project:
+        # another worker may have detected the project's language first, keep whichever was stored
+        language = set_project_language(project, language, replace=False)
+    return language
+
+def morph_features(token):
+    """A token's morphological features from SpaCy, as lowercased (key, value) pairs"""
+    features = []
+    for feature in token.morph:
+        if '=' in feature:
+            key, value = feature.split('=', 1)
+            features.append((key.lower(), value.lower()))
+    return features
 
 def extract_grammatical_features(doc):
     """Extract grammatical features using SpaCy"""
@@ -71,11 +525,7 @@ def extract_grammatical_features(doc):
         token_features['lemma'] = token.lemma_
         
         # extract morphemes if available
-        if token.morph:
-            for feature in token.morph:
-                if '=' in feature:
-                    key, value = feature.split('=', 1)
-                    token_features[key.lower()] = value.lower()
+        token_features.update(morph_features(token))
         
         # dep=dependency
         token_features['dep'] = token.dep_
@@ -84,55 +534,160 @@ def extract_grammatical_features(doc):
     
     return features
 
+def build_analysis_context(text, lexicon, nlp, language, doc=None, features=True):
+    """Bundle the single parse, language and lexicon that every stage of one request reads from"""
+    if doc is None:
+        with stage('parse'):
+            doc = nlp(text)
+    
+    if features:
+        with stage('features'):
+            features = extract_grammatical_features(doc)
+    else:
+        features = {}
+    
+    return {
+        'text': text,
+        'language': language,
+        'nlp': nlp,
+        'doc': doc,
+        'lexicon': lexicon,
+        'features': features
+    }
+
+BUILTIN_ABBREVIATIONS = MappingProxyType({
+    'nominative': 'NOM', 'accusative': 'ACC', 'genitive': 'GEN', 
+    'dative': 'DAT', 'ablative': 'ABL', 'vocative': 'VOC',
+    'instrumental': 'INS', 'locative': 'LOC', 'partitive': 'PART',
+    
+    'masculine': 'MASC', 'feminine': 'FEM', 'neuter': 'NEUT',
+    'masc': 'MASC', 'fem': 'FEM', 'neut': 'NEUT',
+    
+    'singular': 'SG', 'plural': 'PL', 'dual': 'DU',
+    'sing': 'SG', 'plur': 'PL',
+    
+    'first': '1', 'second': '2', 'third': '3',
+    '1': '1', '2': '2', '3': '3',
+    
+    'present': 'PRES', 'past': 'PAST', 'future': 'FUT',
+    'perfect': 'PERF', 'imperfect': 'IMPERF', 'pluperfect': 'PLUP',
+    'pres': 'PRES', 'fut': 'FUT',
+    
+    'progressive': 'PROG', 'perfective': 'PFV', 'imperfective': 'IPFV',
+    'prog': 'PROG', 'pfv': 'PFV', 'ipfv': 'IPFV',
+    
+    'indicative': 'IND', 'subjunctive': 'SUBJ', 'imperative': 'IMP',
+    'conditional': 'COND', 'optative': 'OPT',
+    'ind': 'IND', 'subj': 'SUBJ', 'imp': 'IMP', 'cond': 'COND',
+    
+    'active': 'ACT', 'passive': 'PASS', 'middle': 'MID',
+    'act': 'ACT', 'pass': 'PASS',
+    
+    'definite': 'DEF', 'indefinite': 'INDEF',
+    'def': 'DEF', 'indef': 'INDEF',
+    
+    'positive': 'POS', 'comparative': 'COMP', 'superlative': 'SUP',
+    'pos': 'POS', 'comp': 'COMP', 'sup': 'SUP',
+    
+    'animate': 'ANIM', 'inanimate': 'INAN',
+    'anim': 'ANIM', 'inan': 'INAN',
+    
+    'finite': 'FIN', 'infinite': 'INF',
+    'fin': 'FIN', 'inf': 'INF',
+    
+    'positive': 'POS', 'negative': 'NEG',
+    'pos': 'POS', 'neg': 'NEG',
+    
+    'noun': 'N', 'verb': 'V', 'adjective': 'ADJ', 'adverb': 'ADV',
+    'preposition': 'PREP', 'conjunction': 'CONJ', 'determiner': 'DET',
+    'pronoun': 'PRON', 'particle': 'PART', 'interjection': 'INTERJ'
+})
+
+POS_FEATURE_MAP = MappingProxyType({
+    'NOUN': ('case', 'number', 'gender', 'animacy', 'definiteness'),
+    'PRON': ('case', 'number', 'gender', 'person'),
+    'ADJ': ('case', 'number', 'gender', 'degree'),
+    'VERB': ('tense', 'aspect', 'mood', 'voice', 'person', 'number', 'finiteness'),
+    'AUX': ('tense', 'aspect', 'mood', 'person', 'number'),
+    'DET': ('case', 'number', 'gender', 'definiteness'),
+    'ADP': ('case',),
+    'ADV': ('degree',),
+    'PART': ('polarity',)
+})
+
+IGNORED_FEATURE_VALUES = frozenset(['true', 'false', ''])
+
 def generate_abbreviations():
     """Generate standard abbreviations for grammatical features"""
-    return {
-        'nominative': 'NOM', 'accusative': 'ACC', 'genitive': 'GEN', 
-        'dative': 'DAT', 'ablative': 'ABL', 'vocative': 'VOC',
-        'instrumental': 'INS', 'locative': 'LOC', 'partitive': 'PART',
-        
-        'masculine': 'MASC', 'feminine': 'FEM', 'neuter': 'NEUT',
-        'masc': 'MASC', 'fem': 'FEM', 'neut': 'NEUT',
-        
-        'singular': 'SG', 'plural': 'PL', 'dual': 'DU',
-        'sing': 'SG', 'plur': 'PL',
-        
-        'first': '1', 'second': '2', 'third': '3',
-        '1': '1', '2': '2', '3': '3',
-        
-        'present': 'PRES', 'past': 'PAST', 'future': 'FUT',
-        'perfect': 'PERF', 'imperfect': 'IMPERF', 'pluperfect': 'PLUP',
-        'pres': 'PRES', 'fut': 'FUT',
-        
-        'progressive': 'PROG', 'perfective': 'PFV', 'imperfective': 'IPFV',
-        'prog': 'PROG', 'pfv': 'PFV', 'ipfv': 'IPFV',
-        
-        'indicative': 'IND', 'subjunctive': 'SUBJ', 'imperative': 'IMP',
-        'conditional': 'COND', 'optative': 'OPT',
-        'ind': 'IND', 'subj': 'SUBJ', 'imp': 'IMP', 'cond': 'COND',
-        
-        'active': 'ACT', 'passive': 'PASS', 'middle': 'MID',
-        'act': 'ACT', 'pass': 'PASS',
-        
-        'definite': 'DEF', 'indefinite': 'INDEF',
-        'def': 'DEF', 'indef': 'INDEF',
-        
-        'positive': 'POS', 'comparative': 'COMP', 'superlative': 'SUP',
-        'pos': 'POS', 'comp': 'COMP', 'sup': 'SUP',
-        
-        'animate': 'ANIM', 'inanimate': 'INAN',
-        'anim': 'ANIM', 'inan': 'INAN',
+    return dict(BUILTIN_ABBREVIATIONS)
+
+class GlossRenderer:
+    """Abbreviation table and POS feature map compiled once per abbreviation set"""
+    
+    __slots__ = ('abbreviations', 'pos_features')
+    
+    def __init__(self, abbreviations):
+        # interned labels are shared by every gloss that uses them
+        self.abbreviations = MappingProxyType({sys.intern(key): sys.intern(value) for key, value in abbreviations.items()})
+        self.pos_features = POS_FEATURE_MAP
+    
+    def abbreviate(self, value):
+        return self.abbreviations.get(value.lower())
+    
+    def relevant_features(self, word_features, morpheme_features, pos_tag):
+        """Render a token's feature bundle as Leipzig labels in one pass"""
+        abbreviations = self.abbreviations
+        labels = []
         
-        'finite': 'FIN', 'infinite': 'INF',
-        'fin': 'FIN', 'inf': 'INF',
+        for feature_type in self.pos_features.get(pos_tag, ()):
+            # word features take precedence over the morpheme's
+            if feature_type in word_features:
+                value = word_features[feature_type]
+            elif feature_type in morpheme_features:
+                value = morpheme_features[feature_type]
+            else:
+                continue
+            
+            if value and value.lower() not in IGNORED_FEATURE_VALUES:
+                label = abbreviations.get(value.lower())
+                if label:
+                    labels.append(label)
         
-        'positive': 'POS', 'negative': 'NEG',
-        'pos': 'POS', 'neg': 'NEG',
+        for key, value in morpheme_features.items():
+            if key != 'type' and value.lower() not in IGNORED_FEATURE_VALUES:
+                label = abbreviations.get(value.lower())
+                if label and label not in labels:
+                    labels.append(label)
         
-        'noun': 'N', 'verb': 'V', 'adjective': 'ADJ', 'adverb': 'ADV',
-        'preposition': 'PREP', 'conjunction': 'CONJ', 'determiner': 'DET',
-        'pronoun': 'PRON', 'particle': 'PART', 'interjection': 'INTERJ'
-    }
+        return labels
+
+DEFAULT_RENDERER = GlossRenderer(BUILTIN_ABBREVIATIONS)
+RENDERER_CACHE = LRUCache(64)
+
+def parse_gloss_abbreviations(gloss_abbreviations):
+    """Parse custom 'value=LABEL' abbreviation lines"""
+    custom_abbrevs = {}
+    for line in gloss_abbreviations.strip().split('\n'):
+        if '=' in line:
+            key, value = line.split('=', 1)
+            custom_abbrevs[key.strip().lower()] = value.strip().upper()
+    return custom_abbrevs
+
+def get_gloss_renderer(gloss_abbreviations=''):
+    """Renderer for the built-in abbreviations plus a user's custom ones, compiled once per distinct set"""
+    gloss_abbreviations = gloss_abbreviations.strip()
+    if not gloss_abbreviations:
+        return DEFAULT_RENDERER
+    
+    key = hashlib.sha256(gloss_abbreviations.encode('utf-8')).hexdigest()
+    renderer = RENDERER_CACHE.get(key)
+    if renderer is None:
+        abbreviations = generate_abbreviations()
+        abbreviations.update(parse_gloss_abbreviations(gloss_abbreviations))
+        renderer = GlossRenderer(abbreviations)
+        RENDERER_CACHE.put(key, renderer)
+    
+    return renderer
 
 def parse_morpheme_data(morphemes):
     """Parse morpheme data and classify as prefixes, roots, or suffixes"""
@@ -140,7 +695,8 @@ def parse_morpheme_data(morphemes):
         'prefixes': {},
         'suffixes': {},
         'roots': {},
-        'infixes': {}
+        'infixes': {},
+        'circumfixes': {}
     }
     
     for line in morphemes.strip().split('\n'):
@@ -164,123 +720,393 @@ def parse_morpheme_data(morphemes):
                 else:
                     features[part.lower()] = 'true'
         
-        # sans '-' for storage
-        clean_morpheme = morpheme.strip('-')
+        # sans '-' (and the <> of infixes) for storage
+        clean_morpheme = morpheme.strip('-<>')
         
         morpheme_type = features.get('type', '').lower()
         
-        if morpheme_type == 'prefix' or morpheme.endswith('-'):
+        # an explicit type= wins over the notation
+        if morpheme_type == 'circumfix' or (not morpheme_type and '...' in morpheme):
+            # circumfixes are written ge-...-t and stored as ge...t
+            prefix_part, _, suffix_part = (part.strip('-') for part in morpheme.partition('...'))
+            if not (prefix_part and suffix_part):
+                raise ValueError(f"Circumfix '{morpheme}' needs a part on both sides of '...', e.g. ge-...-t")
+            morpheme_data['circumfixes'][f'{prefix_part}...{suffix_part}'] = features
+        elif morpheme_type == 'prefix':
             morpheme_data['prefixes'][clean_morpheme] = features
-        elif morpheme_type == 'suffix' or morpheme.startswith('-'):
+        elif morpheme_type == 'suffix':
             morpheme_data['suffixes'][clean_morpheme] = features
         elif morpheme_type == 'infix':
             morpheme_data['infixes'][clean_morpheme] = features
+        elif morpheme_type == 'root':
+            morpheme_data['roots'][clean_morpheme] = features
+        elif (morpheme.startswith('<') and morpheme.endswith('>')) or (len(morpheme) > 2 and morpheme.startswith('-') and morpheme.endswith('-')):
+            morpheme_data['infixes'][clean_morpheme] = features
+        elif morpheme.endswith('-'):
+            morpheme_data['prefixes'][clean_morpheme] = features
+        elif morpheme.startswith('-'):
+            morpheme_data['suffixes'][clean_morpheme] = features
         else:
             morpheme_data['roots'][clean_morpheme] = features
     
     return morpheme_data
 
-def find_morpheme_boundaries(word, morpheme_data):
-    """Find morpheme boundaries in a word using longest-match algorithm"""
-    word_lower = word.lower()
-    segments = []
+def build_affix_trie(affixes, reverse=False):
+    """Build a character trie over affixes, reversed for suffixes so they can be matched from the word end"""
+    trie = {}
     
-    # find prefixes (longest first)
-    remaining = word_lower
-    original_remaining = word
-    
-    while remaining:
-        found_prefix = False
-        # sort by length (longest first) to prefer longer matches
-        for prefix in sorted(morpheme_data['prefixes'].keys(), key=len, reverse=True):
-            if remaining.startswith(prefix.lower()) and len(prefix) < len(remaining):
-                segments.append({
-                    'morpheme': original_remaining[:len(prefix)],
-                    'type': 'prefix',
-                    'features': morpheme_data['prefixes'][prefix]
-                })
-                remaining = remaining[len(prefix):]
-                original_remaining = original_remaining[len(prefix):]
-                found_prefix = True
-                break
+    for affix in affixes:
+        key = affix.lower()
+        if not key:
+            continue
+        if reverse:
+            key = key[::-1]
         
-        if not found_prefix:
-            break
+        node = trie
+        for char in key:
+            node = node.setdefault(char, {})
+        # None marks the end of an affix; keep the first entry so ties resolve like the old sorted scan
+        node.setdefault(None, affix)
     
-    # find suffixes (longest first)
-    suffix_segments = []
-    temp_remaining = remaining
-    temp_original = original_remaining
-    
-    while temp_remaining:
-        found_suffix = False
-        for suffix in sorted(morpheme_data['suffixes'].keys(), key=len, reverse=True):
-            if temp_remaining.endswith(suffix.lower()) and len(suffix) < len(temp_remaining):
-                suffix_start = len(temp_remaining) - len(suffix)
-                suffix_segments.insert(0, {
-                    'morpheme': temp_original[suffix_start:],
-                    'type': 'suffix',
-                    'features': morpheme_data['suffixes'][suffix]
-                })
-                temp_remaining = temp_remaining[:suffix_start]
-                temp_original = temp_original[:suffix_start]
-                found_suffix = True
-                break
-        
-        if not found_suffix:
+    return trie
+
+def match_affixes(trie, word, reverse=False):
+    """Return every affix in the trie matching the start (or end) of word, shortest first"""
+    matches = []
+    node = trie
+    
+    for char in (reversed(word) if reverse else word):
+        node = node.get(char)
+        if node is None:
             break
+        if None in node:
+            matches.append(node[None])
     
-    # now only root is left
-    if temp_remaining:
-        root_features = morpheme_data['roots'].get(temp_remaining, {})
-        segments.append({
-            'morpheme': temp_original,
-            'type': 'root',
-            'features': root_features
-        })
+    return matches
+
+def build_pattern_automaton(patterns):
+    """Build an Aho-Corasick automaton (goto, fail and output tables) over a set of patterns"""
+    goto = [{}]
+    fail = [0]
+    output = [[]]
     
-    segments.extend(suffix_segments)
+    for pattern in patterns:
+        key = pattern.lower()
+        if not key:
+            continue
+        state = 0
+        for char in key:
+            next_state = goto[state].get(char)
+            if next_state is None:
+                next_state = len(goto)
+                goto[state][char] = next_state
+                goto.append({})
+                fail.append(0)
+                output.append([])
+            state = next_state
+        output[state].append(pattern)
     
-    return segments
+    # breadth-first, so every fail target is finished before the states that fall back to it
+    pending = deque(goto[0].values())
+    while pending:
+        state = pending.popleft()
+        for char, next_state in goto[state].items():
+            pending.append(next_state)
+            fallback = fail[state]
+            while fallback and char not in goto[fallback]:
+                fallback = fail[fallback]
+            fail[next_state] = goto[fallback].get(char, 0)
+            output[next_state] = output[next_state] + output[fail[next_state]]
+    
+    return {'goto': goto, 'fail': fail, 'output': output}
 
-def get_relevant_features(word_features, morpheme_features, pos_tag):
-    """Get only relevant grammatical features based on POS and context"""
-    relevant_features = []
-    abbreviations = generate_abbreviations()
-    
-    all_features = {}
-    all_features.update(morpheme_features)
-    all_features.update(word_features)
-    
-    pos_feature_map = {
-        'NOUN': ['case', 'number', 'gender', 'animacy', 'definiteness'],
-        'PRON': ['case', 'number', 'gender', 'person'],
-        'ADJ': ['case', 'number', 'gender', 'degree'],
-        'VERB': ['tense', 'aspect', 'mood', 'voice', 'person', 'number', 'finiteness'],
-        'AUX': ['tense', 'aspect', 'mood', 'person', 'number'],
-        'DET': ['case', 'number', 'gender', 'definiteness'],
-        'ADP': ['case'],
-        'ADV': ['degree'],
-        'PART': ['polarity']
-    }
+def find_patterns(automaton, text):
+    """Return every (start, pattern) occurrence of the automaton's patterns in text, in one scan"""
+    goto, fail, output = automaton['goto'], automaton['fail'], automaton['output']
+    matches = []
+    state = 0
     
-    relevant_feature_types = pos_feature_map.get(pos_tag, [])
+    for index, char in enumerate(text):
+        while state and char not in goto[state]:
+            state = fail[state]
+        state = goto[state].get(char, 0)
+        for pattern in output[state]:
+            matches.append((index + 1 - len(pattern), pattern))
     
-    for feature_type in relevant_feature_types:
-        if feature_type in all_features:
-            value = all_features[feature_type]
-            if value and value.lower() not in ['true', 'false', '']:
-                abbrev = abbreviations.get(value.lower())
-                if abbrev:
-                    relevant_features.append(abbrev)
+    return matches
+
+def compile_lexicon(morpheme_data):
+    """Compile parsed morpheme data once into tries and a root index for segmentation"""
+    lexicon = dict(morpheme_data)
+    lexicon['prefix_trie'] = build_affix_trie(morpheme_data['prefixes'])
+    lexicon['suffix_trie'] = build_affix_trie(morpheme_data['suffixes'], reverse=True)
     
-    for key, value in morpheme_features.items():
-        if key not in ['type'] and value.lower() not in ['true', 'false', '']:
-            abbrev = abbreviations.get(value.lower())
-            if abbrev and abbrev not in relevant_features:
-                relevant_features.append(abbrev)
+    root_index = {}
+    for root, features in morpheme_data['roots'].items():
+        root_index.setdefault(root.lower(), features)
+    lexicon['root_index'] = root_index
+    lexicon['root_trie'] = build_affix_trie(root_index)
+    
+    lexicon.setdefault('infixes', {})
+    lexicon['infix_automaton'] = build_pattern_automaton(lexicon['infixes'])
+    
+    # circumfixes are matched by their prefix part, then checked against the end of the word
+    circumfix_parts = {}
+    for circumfix in lexicon.setdefault('circumfixes', {}):
+        prefix_part, suffix_part = circumfix.split('...', 1)
+        circumfix_parts.setdefault(prefix_part.lower(), []).append((suffix_part.lower(), circumfix))
+    lexicon['circumfix_parts'] = circumfix_parts
+    lexicon['circumfix_trie'] = build_affix_trie(circumfix_parts)
+    
+    return lexicon
+
+def lexicon_size(lexicon):
+    """approximate_size of a lexicon, plus the arrays and vocabulary inside its fitted predictor"""
+    size = approximate_size(lexicon)
+    predictor = lexicon.get('predictor')
+    if predictor:
+        matrix = predictor['matrix']
+        size += matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes
+        size += approximate_size(predictor['vectorizer'].vocabulary_) + predictor['vectorizer'].idf_.nbytes
+    return size
+
+LEXICON_CACHE = LRUCache(LEXICON_CACHE_SIZE, LEXICON_CACHE_MB * 1024 * 1024, sizeof=lexicon_size)
+
+def lexicon_id_for(morphemes):
+    """Content hash used as the ID of an uploaded lexicon"""
+    return hashlib.sha256(morphemes.strip().encode('utf-8')).hexdigest()[:16]
+
+def register_lexicon(morphemes):
+    """Parse and compile a lexicon once, returning the cached copy if it was already uploaded"""
+    lexicon_id = lexicon_id_for(morphemes)
+    lexicon = LEXICON_CACHE.get(lexicon_id)
+    if lexicon is not None:
+        return lexicon
+    
+    lexicon = compile_lexicon(parse_morpheme_data(morphemes))
+    lexicon['id'] = lexicon_id
+    lexicon['morpheme_count'] = len([line for line in morphemes.split('\n') if ':' in line])
+    # kept so the project store can save it and diff later versions against it
+    lexicon['source'] = morphemes
+    LEXICON_CACHE.put(lexicon_id, lexicon)
+    
+    return lexicon
+
+def get_lexicon(lexicon_id):
+    """Look up a previously uploaded lexicon, or None if it was never uploaded or has been evicted"""
+    lexicon = LEXICON_CACHE.get(lexicon_id)
+    if lexicon is None and os.path.exists(PROJECT_DB):
+        # lexicons saved in the project store survive eviction and restarts
+        morphemes = stored_lexicon_text(lexicon_id)
+        if morphemes is not None:
+            lexicon = register_lexicon(morphemes)
+    return lexicon
+
+def best_paths(paths, n):
+    """Keep the n best (score, affixes) paths, ties going to fewer affixes"""
+    if len(paths) > 1:
+        paths.sort(key=lambda path: (-path[0], len(path[1])))
+        del paths[n:]
+    return paths
+
+def lattice_candidates(word_lower, lo, hi, n, morpheme_data, infixes):
+    """The n best prefix*/root/suffix* analyses of word_lower[lo:hi], best first"""
+    affix_weight = LATTICE_COVERAGE_WEIGHT / len(word_lower)
+    morpheme_penalty = LATTICE_MORPHEME_PENALTY / len(word_lower)
+    
+    # affix chains only ever meet at a position, so the best n chains into (or out of) each
+    # position are computed once and shared by every analysis passing through it
+    prefix_paths = {lo: [(0.0, ())]}
+    for start in range(lo, hi):
+        if start not in prefix_paths:
+            continue
+        best_paths(prefix_paths[start], n)
+        for prefix in match_affixes(morpheme_data['prefix_trie'], word_lower[start:hi]):
+            end = start + len(prefix)
+            # a root of at least one character must be left
+            if end < hi:
+                step = affix_weight * len(prefix) - morpheme_penalty
+                prefix_paths.setdefault(end, []).extend((score + step, path + (prefix,)) for score, path in prefix_paths[start])
+    
+    suffix_paths = {hi: [(0.0, ())]}
+    for end in range(hi, lo, -1):
+        if end not in suffix_paths:
+            continue
+        best_paths(suffix_paths[end], n)
+        for suffix in match_affixes(morpheme_data['suffix_trie'], word_lower[lo:end], reverse=True):
+            start = end - len(suffix)
+            if start > lo:
+                step = affix_weight * len(suffix) - morpheme_penalty
+                suffix_paths.setdefault(start, []).extend((score + step, (suffix,) + path) for score, path in suffix_paths[end])
+    
+    # keep a bounded heap of the n best analyses; known roots go first, so that most unknown
+    # root spans can be skipped as soon as their best possible score can't beat the heap
+    candidates = []
+    order = 0
+    
+    def add_span(root_start, root_end, known, prefixes, suffixes, infix=None, infix_score=0.0):
+        nonlocal order
+        root_score = (LATTICE_KNOWN_ROOT_WEIGHT if known else 0.0) - morpheme_penalty + infix_score
+        for index, (prefix_score, prefix_path) in enumerate(prefixes):
+            if len(candidates) == n and prefix_score + root_score + suffixes[0][0] <= candidates[0][0]:
+                # only when even the best prefix path can't beat the heap is every later root end ruled out
+                return index > 0
+            for suffix_score, suffix_path in suffixes:
+                score = prefix_score + root_score + suffix_score
+                if len(candidates) == n and score <= candidates[0][0]:
+                    break
+                # ties go to fewer morphemes, then to the analysis found first
+                order += 1
+                morphemes = len(prefix_path) + len(suffix_path) + (infix is not None)
+                entry = (score, -morphemes, -order, prefix_path, root_start, root_end, infix, suffix_path, known)
+                if len(candidates) < n:
+                    heapq.heappush(candidates, entry)
+                else:
+                    heapq.heapreplace(candidates, entry)
+        return True
+    
+    known_spans = set()
+    for root_start, prefixes in sorted(prefix_paths.items()):
+        for root in match_affixes(morpheme_data['root_trie'], word_lower[root_start:hi]):
+            root_end = root_start + len(root)
+            if root_end in suffix_paths:
+                known_spans.add((root_start, root_end))
+                add_span(root_start, root_end, True, prefixes, suffix_paths[root_end])
+    
+    # an infix splits a root, so it only counts when the root left after removing it is known
+    for infix_start, infix in infixes:
+        infix_end = infix_start + len(infix)
+        if infix_start <= lo or infix_end >= hi:
+            continue
+        infix_score = affix_weight * len(infix) - morpheme_penalty
+        for root_start, prefixes in sorted(prefix_paths.items()):
+            if root_start >= infix_start:
+                break
+            for root_end, suffixes in suffix_paths.items():
+                if root_end > infix_end and word_lower[root_start:infix_start] + word_lower[infix_end:root_end] in morpheme_data['root_index']:
+                    add_span(root_start, root_end, True, prefixes, suffixes, (infix_start, infix), infix_score)
+    
+    suffix_order = sorted(suffix_paths, key=lambda end: -suffix_paths[end][0][0])
+    for root_start, prefixes in sorted(prefix_paths.items()):
+        for root_end in suffix_order:
+            if root_end > root_start and (root_start, root_end) not in known_spans:
+                # suffix positions are in descending order of their best score, so the rest can't do better
+                if not add_span(root_start, root_end, False, prefixes, suffix_paths[root_end]):
+                    break
+    
+    return sorted(candidates, reverse=True)
+
+def segment_lattice(word, morpheme_data, n=1):
+    """Rank the n best analyses of a word that the lexicon allows: prefix*/root/suffix*,
+    optionally with an infix inside the root and a circumfix around the whole"""
+    if 'infix_automaton' not in morpheme_data:
+        morpheme_data = compile_lexicon(morpheme_data)
+    
+    word_lower = word.lower()
+    length = len(word_lower)
+    if not length:
+        return []
+    
+    # every infix occurrence in the word, found in one pass whatever the number of infixes
+    infixes = find_patterns(morpheme_data['infix_automaton'], word_lower) if morpheme_data['infixes'] else []
+    candidates = [(*entry, None) for entry in lattice_candidates(word_lower, 0, length, n, morpheme_data, infixes)]
+    
+    # a circumfix wraps an ordinary analysis of what lies between its two parts
+    for prefix_part in match_affixes(morpheme_data['circumfix_trie'], word_lower):
+        for suffix_part, circumfix in morpheme_data['circumfix_parts'][prefix_part]:
+            inner_end = length - len(suffix_part)
+            if len(prefix_part) < inner_end and word_lower.endswith(suffix_part):
+                step = (LATTICE_COVERAGE_WEIGHT * (len(prefix_part) + len(suffix_part)) - LATTICE_MORPHEME_PENALTY) / length
+                candidates.extend((entry[0] + step, entry[1] - 1, *entry[2:], circumfix) for entry in
+                                  lattice_candidates(word_lower, len(prefix_part), inner_end, n, morpheme_data, infixes))
+    candidates.sort(key=lambda entry: entry[:3], reverse=True)
+    
+    analyses = []
+    for score, _, _, prefix_path, root_start, root_end, infix, suffix_path, known, circumfix in candidates[:n]:
+        segments = []
+        if circumfix:
+            prefix_part, suffix_part = circumfix.split('...', 1)
+            segments.append({'morpheme': word[:len(prefix_part)], 'type': 'circumfix', 'features': morpheme_data['circumfixes'][circumfix],
+                             'part': 'prefix', 'spans': ((0, len(prefix_part)),)})
+        position = root_start - sum(len(prefix) for prefix in prefix_path)
+        for prefix in prefix_path:
+            segments.append({'morpheme': word[position:position + len(prefix)], 'type': 'prefix', 'features': morpheme_data['prefixes'][prefix],
+                             'spans': ((position, position + len(prefix)),)})
+            position += len(prefix)
+        if infix:
+            infix_start, infix_key = infix
+            infix_end = infix_start + len(infix_key)
+            root = word_lower[root_start:infix_start] + word_lower[infix_end:root_end]
+            segments.append({'morpheme': word[root_start:infix_start] + word[infix_end:root_end], 'type': 'root', 'features': morpheme_data['root_index'][root],
+                             'infix_at': infix_start - root_start, 'spans': ((root_start, infix_start), (infix_end, root_end))})
+            segments.append({'morpheme': word[infix_start:infix_end], 'type': 'infix', 'features': morpheme_data['infixes'][infix_key],
+                             'spans': ((infix_start, infix_end),)})
+        else:
+            segments.append({'morpheme': word[root_start:root_end], 'type': 'root', 'features': morpheme_data['root_index'].get(word_lower[root_start:root_end], {}),
+                             'spans': ((root_start, root_end),)})
+        position = root_end
+        for suffix in suffix_path:
+            segments.append({'morpheme': word[position:position + len(suffix)], 'type': 'suffix', 'features': morpheme_data['suffixes'][suffix],
+                             'spans': ((position, position + len(suffix)),)})
+            position += len(suffix)
+        if circumfix:
+            segments.append({'morpheme': word[length - len(suffix_part):], 'type': 'circumfix', 'features': morpheme_data['circumfixes'][circumfix],
+                             'part': 'suffix', 'spans': ((length - len(suffix_part), length),)})
+        analyses.append({'segments': segments, 'score': score, 'root_known': known})
     
-    return relevant_features
+    return analyses
+
+def render_segments(segments):
+    """Write out a segmentation with Leipzig boundaries: un-do-s, s<um>ulat, ge-spiel-t"""
+    parts = []
+    for index, segment in enumerate(segments):
+        morpheme = segment['morpheme']
+        morpheme_type = segment['type']
+        if morpheme_type == 'prefix' or (morpheme_type == 'circumfix' and segment['part'] == 'prefix'):
+            parts.append(f"{morpheme}-")
+        elif morpheme_type in ('suffix', 'circumfix'):
+            parts.append(f"-{morpheme}")
+        elif morpheme_type == 'infix':
+            # written inside the root it splits
+            continue
+        elif 'infix_at' in segment:
+            at = segment['infix_at']
+            parts.append(f"{morpheme[:at]}<{segments[index + 1]['morpheme']}>{morpheme[at:]}")
+        else:
+            parts.append(morpheme)
+    
+    if len(parts) > 1:
+        # clean up multiple hyphens
+        return re.sub(r'-{2,}', '-', ''.join(parts))
+    return parts[0] if parts else ''
+
+def find_morpheme_boundaries(word, morpheme_data):
+    """Find morpheme boundaries in a word: the best analysis of the segmentation lattice"""
+    analyses = segment_lattice(word, morpheme_data, 1)
+    return analyses[0]['segments'] if analyses else []
+
+def rank_analyses(word, lexicon, n, use_predictions=False):
+    """The n best analyses of a word, optionally re-ranked by how confidently unknown roots can be glossed"""
+    # rank from a wider pool, so a confident prediction can lift an analysis into the top n
+    analyses = segment_lattice(word, lexicon, n * 2 if use_predictions else n)
+    
+    if use_predictions:
+        unknown = [analysis['segments'][[segment['type'] for segment in analysis['segments']].index('root')]['morpheme'].lower()
+                   for analysis in analyses if not analysis['root_known']]
+        predictions = predict_glosses(lexicon, unknown)
+        for analysis in analyses:
+            if not analysis['root_known']:
+                root = next(segment for segment in analysis['segments'] if segment['type'] == 'root')
+                candidates = predictions.get(root['morpheme'].lower())
+                if candidates:
+                    analysis['score'] += LATTICE_PREDICTION_WEIGHT * candidates[0]['confidence']
+        analyses.sort(key=lambda analysis: -analysis['score'])
+    
+    return analyses[:n]
+
+def get_relevant_features(word_features, morpheme_features, pos_tag):
+    """Get only relevant grammatical features based on POS and context"""
+    return DEFAULT_RENDERER.relevant_features(word_features, morpheme_features, pos_tag)
 
 def is_article_or_function_word(word, language): #we unfortunately had to hard code this part,
                                                 # as it seemed to be the only words that our program
@@ -302,7 +1128,99 @@ def is_article_or_function_word(word, language): #we unfortunately had to hard c
     
     return word.lower() in articles_by_language.get(language, [])
 
-def generate_pseudo_translation(segments, pos_tag):
+def lexicon_entry_gloss(morpheme, features, abbreviations):
+    """Gloss label of a lexicon entry: its meaning, else its feature abbreviations, else its form"""
+    if features.get('meaning'):
+        return features['meaning']
+    
+    labels = [abbreviations[value] for key, value in features.items() if key != 'type' and value in abbreviations]
+    return '.'.join(labels) if labels else morpheme.lower()
+
+def build_gloss_predictor(lexicon):
+    """Fit one character n-gram matrix over a lexicon's roots and affixes, grouped by morpheme type"""
+    abbreviations = DEFAULT_RENDERER.abbreviations
+    entries = []
+    spans = {}
+    
+    for category, morpheme_type in [('roots', 'root'), ('prefixes', 'prefix'), ('suffixes', 'suffix'), ('infixes', 'infix')]:
+        start = len(entries)
+        for morpheme, features in lexicon[category].items():
+            if morpheme:
+                entries.append((morpheme, lexicon_entry_gloss(morpheme, features, abbreviations)))
+        spans[morpheme_type] = (start, len(entries))
+    
+    if not entries:
+        return None
+    
+    import numpy as np
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    
+    vectorizer = TfidfVectorizer(analyzer='char_wb', ngram_range=PREDICTION_NGRAM_RANGE, dtype=np.float32)
+    matrix = vectorizer.fit_transform([morpheme for morpheme, _ in entries])
+    
+    return {
+        'vectorizer': vectorizer,
+        'matrix': matrix,
+        'morphemes': [morpheme for morpheme, _ in entries],
+        'glosses': [gloss for _, gloss in entries],
+        'spans': spans
+    }
+
+PREDICTOR_LOCK = threading.Lock()
+
+def get_gloss_predictor(lexicon):
+    """Build a lexicon's predictor on first use and keep it with the lexicon"""
+    if 'predictor' not in lexicon:
+        with PREDICTOR_LOCK:
+            if 'predictor' not in lexicon:
+                lexicon['predictor'] = build_gloss_predictor(lexicon)
+                # the predictor is usually bigger than the lexicon itself, count it against the cache budget
+                LEXICON_CACHE.resize(lexicon.get('id'))
+    return lexicon['predictor']
+
+def predict_glosses(lexicon, unknown_morphemes, morpheme_type='root', top_k=PREDICTION_TOP_K):
+    """Score all unknown morphemes against the lexicon in one sparse product, returning top-k glosses for each"""
+    unknown = list(dict.fromkeys(morpheme.lower() for morpheme in unknown_morphemes))
+    predictor = get_gloss_predictor(lexicon) if unknown else None
+    if predictor is None:
+        return {}
+    
+    start, end = predictor['spans'][morpheme_type]
+    if start == end:
+        return {morpheme: [] for morpheme in unknown}
+    
+    import numpy as np
+    from sklearn.metrics.pairwise import cosine_similarity
+    
+    vectors = predictor['vectorizer'].transform(unknown)
+    scores = cosine_similarity(vectors, predictor['matrix'][start:end], dense_output=False).tocsr()
+    
+    predictions = {}
+    for row, morpheme in enumerate(unknown):
+        row_start, row_end = scores.indptr[row], scores.indptr[row + 1]
+        values = scores.data[row_start:row_end]
+        columns = scores.indices[row_start:row_end]
+        
+        candidates = []
+        seen = set()
+        for position in np.argsort(-values):
+            gloss = predictor['glosses'][start + columns[position]]
+            if gloss in seen:
+                continue
+            seen.add(gloss)
+            candidates.append({
+                'gloss': gloss,
+                'morpheme': predictor['morphemes'][start + columns[position]],
+                'confidence': round(float(values[position]), 3)
+            })
+            if len(candidates) == top_k:
+                break
+        
+        predictions[morpheme] = candidates
+    
+    return predictions
+
+def generate_pseudo_translation(segments, pos_tag, predictions=None):
     """Generate pseudo-translation using morpheme meanings and grammatical features"""
     translation_parts = []
     root_meaning = None
@@ -314,6 +1232,14 @@ def generate_pseudo_translation(segments, pos_tag):
         
         if morpheme_type == 'root':
             root_meaning = features.get('meaning', segment['morpheme'].lower())
+            
+            # unknown roots borrow the most similar lexicon gloss, marked with ? as a guess
+            candidates = (predictions or {}).get(segment['morpheme'].lower())
+            if not features and candidates and candidates[0]['confidence'] >= PREDICTION_MIN_CONFIDENCE:
+                root_meaning = f"{candidates[0]['gloss']}?"
+        elif morpheme_type == 'circumfix' and segment['part'] == 'suffix':
+            # both parts of a circumfix carry the same features; count them once
+            continue
         else:
             # collect features from affixes
             for key, value in features.items():
@@ -323,11 +1249,10 @@ def generate_pseudo_translation(segments, pos_tag):
     if not root_meaning:
         root_meaning = segments[0]['morpheme'].lower() if segments else 'UNKNOWN'
     
-    abbreviations = generate_abbreviations()
     feature_abbrevs = []
     
     for feature in all_features:
-        abbrev = abbreviations.get(feature.lower())
+        abbrev = DEFAULT_RENDERER.abbreviate(feature)
         if abbrev:
             feature_abbrevs.append(abbrev)
     
@@ -341,14 +1266,116 @@ def generate_pseudo_translation(segments, pos_tag):
     else:
         return root_meaning
 
-def segment_morphemes(text, morphemes, nlp, features_dict, include_translation=False):
-    doc = nlp(text)
+WORD_CACHE = LRUCache(WORD_CACHE_SIZE)
+# segment keys beyond morpheme, type and features that the memo has to keep
+SEGMENT_EXTRAS = ('part', 'infix_at')
+
+def word_cache_entry(segments, pos_tag, predictions):
+    """Memo entry for one word form: segment boundaries, rendered gloss and the predictions behind it"""
+    return {
+        'segments': [(segment['type'], segment['spans'], segment['features'], {key: segment[key] for key in SEGMENT_EXTRAS if key in segment})
+                     for segment in segments],
+        'gloss': generate_pseudo_translation(segments, pos_tag, predictions),
+        'predictions': {
+            segment['morpheme'].lower(): predictions[segment['morpheme'].lower()]
+            for segment in segments if segment['morpheme'].lower() in predictions
+        }
+    }
+
+def cached_segments(word, entry):
+    """Rebuild a word's segments from a memo entry, keeping the word's own casing"""
+    segments = []
+    for morpheme_type, spans, features, extras in entry['segments']:
+        segments.append({'morpheme': ''.join(word[start:end] for start, end in spans), 'type': morpheme_type, 'features': features, 'spans': spans, **extras})
+    return segments
+
+def morpheme_labels(features):
+    """Leipzig labels carried by one morpheme's own features"""
+    labels = []
+    for key, value in features.items():
+        if key not in ('type', 'meaning') and value.lower() not in IGNORED_FEATURE_VALUES:
+            label = DEFAULT_RENDERER.abbreviate(value)
+            if label and label not in labels:
+                labels.append(label)
+    return labels
+
+def morpheme_record(segment, predictions):
+    """Store row for one segment: the morpheme, its type, its gloss and its labels"""
+    features = segment['features']
+    labels = morpheme_labels(features)
+    gloss = features.get('meaning')
+    if segment['type'] == 'root' and not features:
+        candidates = predictions.get(segment['morpheme'].lower())
+        if candidates and candidates[0]['confidence'] >= PREDICTION_MIN_CONFIDENCE:
+            gloss = f"{candidates[0]['gloss']}?"
+    elif segment['type'] != 'root' and not gloss:
+        gloss = '.'.join(labels) or None
+    return {'morpheme': segment['morpheme'].lower(), 'type': segment['type'], 'gloss': gloss, 'labels': labels}
+
+def token_record(token, segmented, gloss, labels, morphemes):
+    """Store row for one glossed token"""
+    all_labels = list(labels)
+    for morpheme in morphemes:
+        all_labels.extend(label for label in morpheme['labels'] if label not in all_labels)
+    return {
+        'text': token.text,
+        'pos': token.pos_,
+        'lemma': token.lemma_,
+        'segmented': segmented,
+        'gloss': gloss,
+        'labels': all_labels,
+        'morphemes': morphemes
+    }
+
+def segment_morphemes(context, include_translation=False):
+    """Segment and gloss every token of an analysis context"""
+    morpheme_data = context['lexicon']
+    features_dict = context['features']
+    detected_language = context['language']
     segmented_words = []
     translated_words = []
+    # structured per-token output, only built when the result is going to the project store
+    token_records = [] if context.get('collect_tokens') else None
+    
+    # look every word up in the memo first; only new word forms are segmented,
+    # and their unknown roots are scored in one batch
+    token_entries = {}
+    new_words = {}
+    unknown_roots = []
+    predictions = {}
+    with stage('boundaries'):
+        for token in context['doc']:
+            word_lower = token.text.lower()
+            if token.is_punct or is_article_or_function_word(word_lower, detected_language):
+                continue
+            
+            key = (morpheme_data['id'], word_lower, token.pos_)
+            entry = WORD_CACHE.get(key) if key not in new_words else None
+            if entry is not None:
+                token_entries[token.i] = entry
+                predictions.update(entry['predictions'])
+                continue
+            
+            if key not in new_words:
+                new_words[key] = find_morpheme_boundaries(word_lower, morpheme_data)
+                for segment in new_words[key]:
+                    if segment['type'] == 'root' and segment['morpheme'] not in morpheme_data['root_index']:
+                        unknown_roots.append(segment['morpheme'])
     
-    morpheme_data = parse_morpheme_data(morphemes)
+    with stage('predict'):
+        predictions.update(predict_glosses(morpheme_data, unknown_roots))
+    context['predictions'] = predictions
     
-    for token in doc:
+    for key, segments in new_words.items():
+        new_words[key] = word_cache_entry(segments, key[2], predictions)
+        WORD_CACHE.put(key, new_words[key])
+    
+    for token in context['doc']:
+        key = (morpheme_data['id'], token.text.lower(), token.pos_)
+        if token.i not in token_entries and key in new_words:
+            token_entries[token.i] = new_words[key]
+    
+    for token in context['doc']:
         word = token.text
         word_lower = word.lower()
         
@@ -358,10 +1385,8 @@ def segment_morphemes(text, morphemes, nlp, features_dict, include_translation=F
                 translated_words.append(word)
             continue
         
-        detected_language = detect_language(text)
         if is_article_or_function_word(word_lower, detected_language):
             found_meaning = None
-            morpheme_data = parse_morpheme_data(morphemes)
             
             for category in ['roots', 'prefixes', 'suffixes']:
                 if word_lower in morpheme_data[category]:
@@ -374,9 +1399,14 @@ def segment_morphemes(text, morphemes, nlp, features_dict, include_translation=F
             segmented_words.append(word)
             if include_translation:
                 translated_words.append(found_meaning)
+            if token_records is not None:
+                token_records.append(token_record(token, word, found_meaning, [], [
+                    {'morpheme': word_lower, 'type': 'function', 'gloss': found_meaning, 'labels': []}
+                ]))
             continue
         
-        segments = find_morpheme_boundaries(word, morpheme_data)
+        entry = token_entries[token.i]
+        segments = cached_segments(word, entry)
         
         if not segments:
             # If no morphemes found, treat as single morpheme
@@ -396,33 +1426,18 @@ def segment_morphemes(text, morphemes, nlp, features_dict, include_translation=F
                     translated_words.append(f"{word_lower}.{'.'.join(relevant_features)}")
                 else:
                     translated_words.append(word_lower)
+            if token_records is not None:
+                token_records.append(token_record(token, segmented_word, '.'.join([word_lower] + relevant_features), relevant_features, []))
             continue
         
-        morpheme_parts = []
         all_morpheme_features = {}
         
         for segment in segments:
-            morpheme_text = segment['morpheme']
-            morpheme_type = segment['type']
-            features = segment['features']
-            
-            # add morpheme w markers
-            if morpheme_type == 'prefix':
-                morpheme_parts.append(f"{morpheme_text}-")
-            elif morpheme_type == 'suffix':
-                morpheme_parts.append(f"-{morpheme_text}")
-            else:
-                morpheme_parts.append(morpheme_text)
-            
             # clllect all morpheme features
-            all_morpheme_features.update(features)
+            all_morpheme_features.update(segment['features'])
         
-        if len(morpheme_parts) > 1:
-            segmented_word = ''.join(morpheme_parts)
-            # clean up multiple hyphens
-            segmented_word = re.sub(r'-{2,}', '-', segmented_word)
-        else:
-            segmented_word = morpheme_parts[0] if morpheme_parts else word
+        # add morphemes w markers
+        segmented_word = render_segments(segments) or word
         
         word_features = features_dict.get(word_lower, {})
         
@@ -434,8 +1449,16 @@ def segment_morphemes(text, morphemes, nlp, features_dict, include_translation=F
         segmented_words.append(segmented_word)
         
         if include_translation:
-            pseudo_translation = generate_pseudo_translation(segments, token.pos_)
-            translated_words.append(pseudo_translation)
+            translated_words.append(entry['gloss'])
+        if token_records is not None:
+            morphemes = entry.get('morphemes')
+            if morphemes is None:
+                # morpheme rows are lowercased, so one memo entry's rows serve every casing of the word
+                morphemes = entry['morphemes'] = [morpheme_record(segment, context['predictions']) for segment in segments]
+            token_records.append(token_record(token, segmented_word, entry['gloss'], relevant_features, morphemes))
+    
+    if token_records is not None:
+        context['tokens'] = token_records
     
     if include_translation:
         return ' '.join(segmented_words), ' '.join(translated_words)
@@ -444,98 +1467,1572 @@ def segment_morphemes(text, morphemes, nlp, features_dict, include_translation=F
 
     
 
-@app.route('/')
-def index():
+SEGMENT_FIELDS = ('original', 'segmented', 'pseudo_translation', 'features', 'tokens', 'predictions', 'n_best')
+SEGMENT_FORMATS = ('records', 'columnar')
+
+def parse_fields(value):
+    """Read a per-request field selection, a list or comma-separated string; None selects every field"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = value.split(',')
+    fields = frozenset(str(field).strip() for field in value if str(field).strip())
+    unknown = fields.difference(SEGMENT_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))} (expected any of {', '.join(SEGMENT_FIELDS)})")
+    return fields
+
+def segment_options(data, store_project):
+    """Per-request segmentation settings, shared by every analysis context of the request"""
+    fields = parse_fields(data.get('fields'))
+    response_format = data.get('format', 'records')
+    if response_format not in SEGMENT_FORMATS:
+        raise ValueError(f"Unknown format {response_format!r} (expected one of {', '.join(SEGMENT_FORMATS)})")
+    
+    if fields is None:
+        include_translation = bool(data.get('include_translation', False))
+    else:
+        include_translation = 'pseudo_translation' in fields
+    segmented = fields is None or 'segmented' in fields
+    
+    return {
+        'fields': fields,
+        'format': response_format,
+        'include_translation': include_translation,
+        # per-token records feed the project store, and the columnar segmented/gloss columns
+        'collect_tokens': bool(store_project) or (response_format == 'columnar' and segmented),
+        'needs_features': segmented or bool(store_project) or 'features' in fields,
+        'n_best': parse_n_best(data.get('n_best')),
+        'rank_with_predictions': bool(data.get('rank_with_predictions', False))
+    }
+
+def wants_field(context, field):
+    """Whether a response section was asked for; every section is when no fields were given"""
+    fields = context.get('fields')
+    return fields is None or field in fields
+
+def columnar_tokens(context, words, include_translation):
+    """Parallel per-token arrays, with feature and gloss labels interned into one shared table"""
+    labels = []
+    label_ids = {}
+    
+    def intern(label):
+        label_id = label_ids.get(label)
+        if label_id is None:
+            label_id = label_ids[label] = len(labels)
+            labels.append(label)
+        return label_id
+    
+    columns = {}
+    if wants_field(context, 'tokens'):
+        columns['text'] = [token.text for token in words]
+        columns['pos'] = [token.pos_ for token in words]
+        columns['lemma'] = [token.lemma_ for token in words]
+        columns['tag'] = [token.tag_ for token in words]
+        columns['dep'] = [token.dep_ for token in words]
+    if wants_field(context, 'features'):
+        columns['features'] = [[intern(f'{key}={value}') for key, value in morph_features(token)] for token in words]
+    
+    records = context.get('tokens')
+    if records is not None and wants_field(context, 'segmented'):
+        # records cover every non-punctuation token, spaces included
+        records = [record for token, record in zip((token for token in context['doc'] if not token.is_punct), records) if not token.is_space]
+        columns['segmented'] = [record['segmented'] for record in records]
+        columns['labels'] = [[intern(label) for label in record['labels']] for record in records]
+        if include_translation:
+            columns['gloss'] = [record['gloss'] for record in records]
+    
+    return {'labels': labels, 'tokens': columns}
+
+def build_segment_response(context, segmented_text, pseudo_translation=None):
+    """Assemble the /segment response from an analysis context, with only the sections that were asked for"""
+    doc = context['doc']
+    words = [token for token in doc if not token.is_punct and not token.is_space]
+    
+    analysis = {
+        'morpheme_count': context['lexicon']['morpheme_count'],
+        'word_count': len(words)
+    }
+    if context.get('format') == 'columnar':
+        analysis.update(columnar_tokens(context, words, pseudo_translation is not None))
+    else:
+        if wants_field(context, 'features'):
+            analysis['features'] = context['features']
+        if wants_field(context, 'tokens'):
+            analysis['tokens'] = [{'text': token.text, 'pos': token.pos_, 'lemma': token.lemma_} for token in words]
+    if wants_field(context, 'predictions'):
+        analysis['predictions'] = context.get('predictions', {})
+    
+    response_data = {
+        'language': context['language'],
+        'lexicon_id': context['lexicon']['id'],
+        'analysis': analysis
+    }
+    if context.get('format') == 'columnar':
+        response_data['format'] = 'columnar'
+    if wants_field(context, 'original'):
+        response_data['original'] = context['text']
+    if segmented_text is not None and wants_field(context, 'segmented'):
+        response_data['segmented'] = segmented_text
+    
+    if pseudo_translation:
+        response_data['pseudo_translation'] = pseudo_translation
+    
+    return response_data
+
+@app.errorhandler(RequestEntityTooLarge)
+def upload_too_large(e):
+    return jsonify({'success': False, 'error': f'Upload is larger than the {MAX_UPLOAD_MB} MB limit'}), 413
+
+@app.route('/')
+def index():
     return render_template("linghackshtml.html")
 
+@app.route('/lexicon', methods=['POST'])
+def upload_lexicon():
+    try:
+        data = request.json
+        morphemes = data.get('morphemes', '').strip()
+        
+        if not morphemes:
+            return jsonify({'error': 'Morphemes are required'})
+        
+        lexicon = register_lexicon(morphemes)
+        if data.get('store'):
+            store_lexicon(lexicon['id'], lexicon['source'])
+        
+        return jsonify({
+            'lexicon_id': lexicon['id'],
+            'morpheme_count': lexicon['morpheme_count'],
+            'prefixes': len(lexicon['prefixes']),
+            'suffixes': len(lexicon['suffixes']),
+            'roots': len(lexicon['roots']),
+            'infixes': len(lexicon['infixes']),
+            'circumfixes': len(lexicon['circumfixes'])
+        })
+        
+    except RequestEntityTooLarge:
+        raise
+    
+    except Exception as e:
+        return jsonify({'error': str(e)})
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    g.timings = {}
+    g.include_timings = wants_timings()
+    g.sampler = None
+    if PROFILE_SLOW_MS > 0:
+        g.sampler = StackSampler(threading.get_ident(), PROFILE_INTERVAL_MS / 1000)
+        g.sampler.start()
+
+def wants_timings():
+    """Clients opt into timings in the JSON body with ?timings=1 or "include_timings": true"""
+    if request.args.get('timings') in ('1', 'true'):
+        return True
+    try:
+        data = request.get_json(silent=True)
+    except RequestEntityTooLarge:
+        # decided before the view runs, which raises the 413 itself
+        return False
+    return isinstance(data, dict) and bool(data.get('include_timings'))
+
+# registered before add_request_timings so that it runs after it, on the final body
+@app.after_request
+def compress_response(response):
+    """Gzip large JSON and text responses when the client accepts gzip"""
+    if COMPRESS_MIN_BYTES <= 0 or response.is_streamed or response.direct_passthrough or 'Content-Encoding' in response.headers:
+        return response
+    if not (response.is_json or response.mimetype.startswith('text/')):
+        return response
+    
+    response.vary.add('Accept-Encoding')
+    if not request.accept_encodings['gzip'] or response.content_length is None or response.content_length < COMPRESS_MIN_BYTES:
+        return response
+    
+    with stage('compress'):
+        response.set_data(gzip.compress(response.get_data(), compresslevel=COMPRESS_LEVEL))
+    response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+@app.after_request
+def add_request_timings(response):
+    started = g.get('request_started')
+    if started is None:
+        return response
+    
+    total = time.perf_counter() - started
+    endpoint = request.endpoint or 'none'
+    timings = g.get('timings', {})
+    
+    observe('quickgloss_request_duration_seconds', {'endpoint': endpoint}, total)
+    increment('quickgloss_requests_total', {'endpoint': endpoint, 'status': str(response.status_code)})
+    
+    entries = [f'{name};dur={elapsed * 1000:.3f}' for name, elapsed in timings.items()]
+    entries.append(f'total;dur={total * 1000:.3f}')
+    response.headers['Server-Timing'] = ', '.join(entries)
+    
+    if not response.is_streamed and response.is_json and g.get('include_timings'):
+        body = response.get_json()
+        if isinstance(body, dict):
+            body['timings'] = {name: round(elapsed * 1000, 3) for name, elapsed in timings.items()}
+            body['timings']['total'] = round(total * 1000, 3)
+            response.set_data(json.dumps(body))
+    
+    sampler = g.get('sampler')
+    if sampler is not None:
+        sampler.stop()
+        if total * 1000 >= PROFILE_SLOW_MS and sampler.stacks:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            sampler.dump(os.path.join(PROFILE_DIR, f'{endpoint}-{int(time.time() * 1000)}-{uuid.uuid4().hex[:6]}.folded'))
+    
+    return response
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+def render_metrics():
+    """Render counters, histograms and current cache and queue gauges in Prometheus text format"""
+    lines = []
+    
+    with METRICS_LOCK:
+        counters = sorted(COUNTERS.items())
+        histograms = sorted((key, dict(value, buckets=list(value['buckets']))) for key, value in HISTOGRAMS.items())
+    
+    declared = set()
+    for (name, labels), value in counters:
+        if name not in declared:
+            lines.append(f'# TYPE {name} counter')
+            declared.add(name)
+        lines.append(f'{name}{format_labels(labels)} {value}')
+    
+    for (name, labels), histogram in histograms:
+        if name not in declared:
+            lines.append(f'# TYPE {name} histogram')
+            declared.add(name)
+        for bound, count in zip(HISTOGRAM_BUCKETS, histogram['buckets']):
+            lines.append(f'{name}_bucket{format_labels(labels + (("le", str(bound)),))} {count}')
+        lines.append(f'{name}_bucket{format_labels(labels + (("le", "+Inf"),))} {histogram["count"]}')
+        lines.append(f'{name}_sum{format_labels(labels)} {histogram["sum"]}')
+        lines.append(f'{name}_count{format_labels(labels)} {histogram["count"]}')
+    
+    caches = {
+        'lexicons': LEXICON_CACHE.stats(),
+        'words': WORD_CACHE.stats(),
+        'spacy_models': SPACY_MODELS.stats(),
+        'renderers': RENDERER_CACHE.stats(),
+        'languages': LANGUAGE_CACHE.stats(),
+        'breakdowns': BREAKDOWN_CACHE.stats(),
+        'transcriptions': transcription_cache_stats()
+    }
+    for metric, kind, field in [
+            ('quickgloss_cache_hits_total', 'counter', 'hits'),
+            ('quickgloss_cache_misses_total', 'counter', 'misses'),
+            ('quickgloss_cache_entries', 'gauge', 'entries'),
+            ('quickgloss_cache_bytes', 'gauge', 'bytes'),
+            ('quickgloss_cache_hit_ratio', 'gauge', 'hit_rate')]:
+        lines.append(f'# TYPE {metric} {kind}')
+        for cache_name, stats in caches.items():
+            if field == 'hit_rate' and field not in stats:
+                lookups = stats['hits'] + stats['misses']
+                stats[field] = stats['hits'] / lookups if lookups else 0.0
+            if field in stats:
+                lines.append(f'{metric}{{cache="{cache_name}"}} {stats[field]}')
+    
+    with JOBS_LOCK:
+        job_counts = Counter(job['status'] for job in TRANSCRIPTION_JOBS.values())
+    lines.append('# TYPE quickgloss_transcription_jobs gauge')
+    for status in ('uploading', 'queued', 'running', 'done', 'error'):
+        lines.append(f'quickgloss_transcription_jobs{{status="{status}"}} {job_counts.get(status, 0)}')
+    lines.append('# TYPE quickgloss_transcription_queue_depth gauge')
+    lines.append(f'quickgloss_transcription_queue_depth {len(PENDING_JOBS)}')
+    
+    lines.append('# TYPE quickgloss_whisper_models gauge')
+    lines.append(f'quickgloss_whisper_models{{state="loaded"}} {WHISPER_MODELS_CREATED}')
+    lines.append(f'quickgloss_whisper_models{{state="idle"}} {WHISPER_POOL.qsize()}')
+    
+    return '\n'.join(lines) + '\n'
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/cache_stats', methods=['GET'])
+def cache_stats():
+    return jsonify({
+        'lexicons': LEXICON_CACHE.stats(),
+        'words': WORD_CACHE.stats(),
+        'spacy_models': SPACY_MODELS.stats(),
+        'languages': LANGUAGE_CACHE.stats(),
+        'breakdowns': BREAKDOWN_CACHE.stats(),
+        'transcriptions': transcription_cache_stats()
+    })
+
 @app.route('/segment', methods=['POST'])
 def segment():
     try:
         data = request.json
         text = data.get('text', '').strip()
         morphemes = data.get('morphemes', '').strip()
-        include_translation = data.get('include_translation', False)
+        lexicon_id = data.get('lexicon_id')
+        language = data.get('language')
+        project = data.get('project')
+        store_project = store_requested(data)
+        options = segment_options(data, store_project)
         
-        if not text or not morphemes:
+        if not text or not (morphemes or lexicon_id):
             return jsonify({'error': 'Both text and morphemes are required'})
         
-        language = detect_language(text)
+        with stage('lexicon'):
+            if lexicon_id:
+                lexicon = get_lexicon(lexicon_id)
+            else:
+                lexicon = register_lexicon(morphemes)
         
-
-        nlp = SPACY_MODELS.get(language)
+        if lexicon is None:
+            return jsonify({'error': 'Unknown lexicon_id, please upload the lexicon again'}), 404
+        
+        with stage('langdetect'):
+            language = resolve_language([text], language, project)
+        
+        with stage('spacy_load'):
+            nlp = get_spacy_model(language)
         if not nlp:
-            nlp = SPACY_MODELS.get('en')  # fallback to English
+            return jsonify({'error': 'No SpaCy models available'})
+        
+        context = build_analysis_context(text, lexicon, nlp, language, features=options['needs_features'])
+        context.update(options)
+        
+        with stage('segment'):
+            response_data = segment_one(context, options['include_translation'])
+        
+        if store_project:
+            with stage('store'):
+                store_lexicon(lexicon['id'], lexicon['source'])
+                response_data['sentence_id'] = store_sentences(store_project, [stored_sentence(context)], 'segment', lexicon['id'], language)[0]
+        
+        with stage('serialize'):
+            return jsonify(response_data)
+        
+    except RequestEntityTooLarge:
+        raise
+    
+    except Exception as e:
+        return jsonify({'error': str(e)})
+        
+def stored_sentence(context):
+    """Project store row for one segmented text"""
+    return {
+        'text': context['text'],
+        'segmented': context['segmented'],
+        'translation': context.get('translation'),
+        'tokens': context['tokens']
+    }
+
+def n_best_analyses(context):
+    """The n best segmentations of every word form in a context, for clients that let the user pick one"""
+    lexicon = context['lexicon']
+    n_best = {}
+    for token in context['doc']:
+        word_lower = token.text.lower()
+        if token.is_punct or token.is_space or word_lower in n_best or is_article_or_function_word(word_lower, context['language']):
+            continue
+        n_best[word_lower] = [{
+            'segmentation': render_segments(analysis['segments']),
+            'segments': [{'morpheme': segment['morpheme'], 'type': segment['type']} for segment in analysis['segments']],
+            'score': round(analysis['score'], 4),
+            'root_known': analysis['root_known']
+        } for analysis in rank_analyses(word_lower, lexicon, context['n_best'], context.get('rank_with_predictions', False))]
+    return n_best
+
+def parse_n_best(value):
+    """Read a per-request n_best, clamped to 1..MAX_N_BEST"""
+    try:
+        return max(1, min(int(value), MAX_N_BEST))
+    except (TypeError, ValueError):
+        return 1
+
+def segment_one(context, include_translation):
+    """Run segmentation for one analysis context and build its response"""
+    fields = context.get('fields')
+    if fields is not None and not fields & {'segmented', 'pseudo_translation', 'predictions'} and not context.get('collect_tokens'):
+        # nothing asked for depends on the segmentation itself
+        segmented_text = pseudo_translation = None
+    elif include_translation:
+        segmented_text, pseudo_translation = segment_morphemes(context, include_translation=True)
+    else:
+        segmented_text = segment_morphemes(context, include_translation=False)
+        pseudo_translation = None
+    context['segmented'] = segmented_text
+    context['translation'] = pseudo_translation
+    
+    response_data = build_segment_response(context, segmented_text, pseudo_translation)
+    if context.get('n_best', 1) > 1 and wants_field(context, 'n_best'):
+        with stage('n_best'):
+            response_data['analysis']['n_best'] = n_best_analyses(context)
+    return response_data
+
+@app.route('/segment_batch', methods=['POST'])
+def segment_batch():
+    try:
+        data = request.json
+        texts = data.get('texts')
+        morphemes = data.get('morphemes', '').strip()
+        lexicon_id = data.get('lexicon_id')
+        language = data.get('language')
+        project = data.get('project')
+        store_project = store_requested(data)
+        options = segment_options(data, store_project)
+        batch_size = max(1, int(data.get('batch_size', SEGMENT_BATCH_SIZE)))
+        n_process = max(1, min(int(data.get('n_process', 1)), os.cpu_count() or 1))
+        
+        if not isinstance(texts, list) or not texts or not (morphemes or lexicon_id):
+            return jsonify({'error': 'A list of texts and morphemes are required'})
+        
+        if len(texts) > SEGMENT_BATCH_MAX_TEXTS:
+            return jsonify({'error': f'At most {SEGMENT_BATCH_MAX_TEXTS} texts can be segmented per batch'}), 413
+        
+        if lexicon_id:
+            lexicon = get_lexicon(lexicon_id)
+            if lexicon is None:
+                return jsonify({'error': 'Unknown lexicon_id, please upload the lexicon again'}), 404
+        else:
+            lexicon = register_lexicon(morphemes)
+        
+        results = [None] * len(texts)
+        valid = []
+        for index, text in enumerate(texts):
+            if isinstance(text, str) and text.strip():
+                valid.append((index, text.strip()))
+            else:
+                results[index] = {'index': index, 'error': 'Text is required'}
+        
+        if valid:
+            with stage('langdetect'):
+                language = resolve_language([text for _, text in valid], language, project)
+            
+            nlp = get_spacy_model(language)
             if not nlp:
                 return jsonify({'error': 'No SpaCy models available'})
             
-        doc = nlp(text)
+            done = 0
+            contexts = {}
+            try:
+                docs = nlp.pipe([text for _, text in valid], batch_size=batch_size, n_process=n_process)
+                for (index, text), doc in zip(valid, docs):
+                    done += 1
+                    try:
+                        context = build_analysis_context(text, lexicon, nlp, language, doc=doc, features=options['needs_features'])
+                        context.update(options)
+                        results[index] = {'index': index, **segment_one(context, options['include_translation'])}
+                        contexts[index] = context
+                    except Exception as e:
+                        results[index] = {'index': index, 'error': str(e)}
+            except Exception:
+                # a failure inside nlp.pipe kills the generator, so parse the rest one by one
+                for index, text in valid[done:]:
+                    try:
+                        context = build_analysis_context(text, lexicon, nlp, language, features=options['needs_features'])
+                        context.update(options)
+                        results[index] = {'index': index, **segment_one(context, options['include_translation'])}
+                        contexts[index] = context
+                    except Exception as e:
+                        results[index] = {'index': index, 'error': str(e)}
+            
+            if store_project and contexts:
+                with stage('store'):
+                    store_lexicon(lexicon['id'], lexicon['source'])
+                    stored = sorted(contexts)
+                    sentence_ids = store_sentences(store_project, [stored_sentence(contexts[index]) for index in stored], 'segment', lexicon['id'], language)
+                    for index, sentence_id in zip(stored, sentence_ids):
+                        results[index]['sentence_id'] = sentence_id
         
-        features_dict = extract_grammatical_features(doc)
+        return jsonify({
+            'language': language,
+            'lexicon_id': lexicon['id'],
+            'results': results,
+            'errors': len([result for result in results if 'error' in result])
+        })
         
-        if include_translation:
-            segmented_text, pseudo_translation = segment_morphemes(text, morphemes, nlp, features_dict, include_translation=True)
-        else:
-            segmented_text = segment_morphemes(text, morphemes, nlp, features_dict, include_translation=False)
-            pseudo_translation = None
-        
-        analysis = {
-            'features': features_dict,
-            'morpheme_count': len([line for line in morphemes.split('\n') if ':' in line]),
-            'word_count': len([token for token in doc if not token.is_punct and not token.is_space]),
-            'tokens': [{'text': token.text, 'pos': token.pos_, 'lemma': token.lemma_} for token in doc if not token.is_punct and not token.is_space]
-        }
+    except RequestEntityTooLarge:
+        raise
+    
+    except Exception as e:
+        return jsonify({'error': str(e)})
+
+PROJECT_SCHEMA = """
+CREATE TABLE IF NOT EXISTS projects (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS lexicons (
+    id TEXT PRIMARY KEY,
+    morphemes TEXT NOT NULL,
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sentences (
+    id INTEGER PRIMARY KEY,
+    project_id INTEGER NOT NULL REFERENCES projects(id),
+    lexicon_id TEXT,
+    source TEXT NOT NULL,
+    language TEXT,
+    text TEXT NOT NULL,
+    segmented TEXT,
+    translation TEXT,
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tokens (
+    id INTEGER PRIMARY KEY,
+    project_id INTEGER NOT NULL,
+    sentence_id INTEGER NOT NULL REFERENCES sentences(id),
+    position INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    lower TEXT NOT NULL,
+    pos TEXT,
+    lemma TEXT,
+    segmented TEXT,
+    gloss TEXT
+);
+CREATE TABLE IF NOT EXISTS morphemes (
+    id INTEGER PRIMARY KEY,
+    project_id INTEGER NOT NULL,
+    token_id INTEGER NOT NULL REFERENCES tokens(id),
+    position INTEGER NOT NULL,
+    morpheme TEXT NOT NULL,
+    type TEXT NOT NULL,
+    gloss TEXT COLLATE NOCASE
+);
+CREATE TABLE IF NOT EXISTS word_forms (
+    project_id INTEGER NOT NULL,
+    lower TEXT NOT NULL,
+    PRIMARY KEY (project_id, lower)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS labels (
+    project_id INTEGER NOT NULL,
+    token_id INTEGER NOT NULL REFERENCES tokens(id),
+    label TEXT NOT NULL COLLATE NOCASE,
+    PRIMARY KEY (token_id, label)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS sentences_project ON sentences(project_id, id);
+CREATE INDEX IF NOT EXISTS tokens_sentence ON tokens(sentence_id, position);
+CREATE INDEX IF NOT EXISTS tokens_word ON tokens(project_id, lower, id);
+CREATE INDEX IF NOT EXISTS tokens_pos ON tokens(project_id, pos, id);
+CREATE INDEX IF NOT EXISTS morphemes_token ON morphemes(token_id);
+CREATE INDEX IF NOT EXISTS morphemes_morpheme ON morphemes(project_id, morpheme, token_id);
+CREATE INDEX IF NOT EXISTS morphemes_gloss ON morphemes(project_id, gloss, token_id);
+CREATE INDEX IF NOT EXISTS labels_label ON labels(project_id, label, token_id);
+CREATE INDEX IF NOT EXISTS sentences_lexicon ON sentences(project_id, lexicon_id);
+"""
+
+# one-time data migrations, tracked in PRAGMA user_version; append only
+PROJECT_MIGRATIONS = [
+    # 1: word forms of the tokens stored before the word_forms table existed
+    'INSERT OR IGNORE INTO word_forms (project_id, lower) SELECT DISTINCT project_id, lower FROM tokens;',
+    # 2: sticky project languages, shared by every worker and kept across restarts
+    'ALTER TABLE projects ADD COLUMN language TEXT;'
+]
+
+PROJECT_DB_LOCAL = threading.local()
+PROJECT_SCHEMA_LOCK = threading.Lock()
+PROJECT_SCHEMAS_READY = set()
+
+def project_db():
+    """This thread's connection to the project store; SQLite connections can't be shared across threads"""
+    conn = getattr(PROJECT_DB_LOCAL, 'conn', None)
+    if conn is not None and PROJECT_DB_LOCAL.path == PROJECT_DB:
+        return conn
+    
+    os.makedirs(os.path.dirname(os.path.abspath(PROJECT_DB)), exist_ok=True)
+    conn = sqlite3.connect(PROJECT_DB, timeout=30)
+    conn.row_factory = sqlite3.Row
+    # WAL lets concordance queries read while another worker writes
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('PRAGMA cache_size=-65536')
+    with PROJECT_SCHEMA_LOCK:
+        if PROJECT_DB not in PROJECT_SCHEMAS_READY:
+            conn.executescript(PROJECT_SCHEMA)
+            version = conn.execute('PRAGMA user_version').fetchone()[0]
+            for number, migration in enumerate(PROJECT_MIGRATIONS[version:], version + 1):
+                conn.executescript(f'BEGIN IMMEDIATE; {migration} PRAGMA user_version = {number}; COMMIT;')
+            PROJECT_SCHEMAS_READY.add(PROJECT_DB)
+    
+    PROJECT_DB_LOCAL.conn = conn
+    PROJECT_DB_LOCAL.path = PROJECT_DB
+    return conn
+
+def project_id_for(conn, project, create=False):
+    """Row id of a project by name, creating it when asked; None if it doesn't exist"""
+    row = conn.execute('SELECT id FROM projects WHERE name = ?', (project,)).fetchone()
+    if row is not None:
+        return row['id']
+    if not create:
+        return None
+    return conn.execute('INSERT INTO projects (name, created) VALUES (?, ?)', (project, time.time())).lastrowid
+
+def project_language(project):
+    """A project's sticky language, or None if it has none yet"""
+    row = project_db().execute('SELECT language FROM projects WHERE name = ?', (project,)).fetchone()
+    return row['language'] if row is not None else None
+
+def set_project_language(project, language, replace=True):
+    """Make a language sticky for a project, creating the project if needed; returns the language it ends up with"""
+    update = 'excluded.language' if replace else 'COALESCE(projects.language, excluded.language)'
+    conn = project_db()
+    with conn:
+        conn.execute(
+            f'INSERT INTO projects (name, created, language) VALUES (?, ?, ?) ON CONFLICT(name) DO UPDATE SET language = {update}',
+            (project, time.time(), language)
+        )
+    return project_language(project)
+
+def store_lexicon(lexicon_id, morphemes):
+    """Keep a lexicon's text so it can be recompiled after it falls out of the in-memory cache"""
+    conn = project_db()
+    with conn:
+        conn.execute('INSERT OR IGNORE INTO lexicons (id, morphemes, created) VALUES (?, ?, ?)', (lexicon_id, morphemes, time.time()))
+
+def stored_lexicon_text(lexicon_id):
+    row = project_db().execute('SELECT morphemes FROM lexicons WHERE id = ?', (lexicon_id,)).fetchone()
+    return row['morphemes'] if row is not None else None
+
+def write_tokens(conn, project_id, sentences):
+    """Insert the tokens, morphemes, labels and word forms of (sentence id, tokens) pairs inside an open write transaction"""
+    token_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM tokens').fetchone()[0]
+    
+    token_rows = []
+    morpheme_rows = []
+    label_rows = []
+    word_forms = set()
+    for sentence_id, tokens in sentences:
+        for position, token in enumerate(tokens):
+            token_id += 1
+            lower = token['text'].lower()
+            word_forms.add(lower)
+            token_rows.append((token_id, project_id, sentence_id, position, token['text'], lower, token['pos'], token['lemma'], token['segmented'], token['gloss']))
+            morpheme_rows.extend((project_id, token_id, index, morpheme['morpheme'], morpheme['type'], morpheme['gloss']) for index, morpheme in enumerate(token['morphemes']))
+            label_rows.extend((project_id, token_id, label) for label in token['labels'])
+    
+    conn.executemany('INSERT INTO tokens (id, project_id, sentence_id, position, text, lower, pos, lemma, segmented, gloss) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', token_rows)
+    conn.executemany('INSERT INTO morphemes (project_id, token_id, position, morpheme, type, gloss) VALUES (?, ?, ?, ?, ?, ?)', morpheme_rows)
+    conn.executemany('INSERT OR IGNORE INTO labels (project_id, token_id, label) VALUES (?, ?, ?)', label_rows)
+    conn.executemany('INSERT OR IGNORE INTO word_forms (project_id, lower) VALUES (?, ?)', [(project_id, lower) for lower in word_forms])
+
+def store_sentences(project, sentences, source, lexicon_id=None, language=None):
+    """Write glossed sentences with their tokens, morphemes and labels in one transaction, returning their ids"""
+    conn = project_db()
+    now = time.time()
+    
+    # take the write lock up front, so the ids handed out below can't collide with another writer
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        project_id = project_id_for(conn, project, create=True)
+        first_sentence = conn.execute('SELECT COALESCE(MAX(id), 0) + 1 FROM sentences').fetchone()[0]
+        sentence_ids = list(range(first_sentence, first_sentence + len(sentences)))
         
-        response_data = {
-            'original': text,
-            'segmented': segmented_text,
-            'language': language,
-            'analysis': analysis
+        conn.executemany(
+            'INSERT INTO sentences (id, project_id, lexicon_id, source, language, text, segmented, translation, created) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            [(sentence_id, project_id, lexicon_id, source, language, sentence['text'], sentence.get('segmented'), sentence.get('translation'), now)
+             for sentence_id, sentence in zip(sentence_ids, sentences)]
+        )
+        write_tokens(conn, project_id, [(sentence_id, sentence['tokens']) for sentence_id, sentence in zip(sentence_ids, sentences)])
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    
+    return sentence_ids
+
+def delete_tokens(conn, sentence_ids):
+    """Remove the tokens, morphemes and labels of sentences inside an open write transaction"""
+    for start in range(0, len(sentence_ids), 500):
+        chunk = sentence_ids[start:start + 500]
+        placeholders = ','.join('?' * len(chunk))
+        token_ids = f'SELECT id FROM tokens WHERE sentence_id IN ({placeholders})'
+        conn.execute(f'DELETE FROM labels WHERE token_id IN ({token_ids})', chunk)
+        conn.execute(f'DELETE FROM morphemes WHERE token_id IN ({token_ids})', chunk)
+        conn.execute(f'DELETE FROM tokens WHERE sentence_id IN ({placeholders})', chunk)
+
+LEXICON_CATEGORY_TYPES = {'prefixes': 'prefix', 'suffixes': 'suffix', 'roots': 'root', 'infixes': 'infix', 'circumfixes': 'circumfix'}
+
+def diff_lexicons(old_data, new_data):
+    """Morphemes added, removed or given different features between two parsed lexicons"""
+    changes = {'added': [], 'removed': [], 'modified': []}
+    for category, morpheme_type in LEXICON_CATEGORY_TYPES.items():
+        old_entries = old_data.get(category, {})
+        new_entries = new_data.get(category, {})
+        for morpheme in new_entries.keys() - old_entries.keys():
+            changes['added'].append((morpheme_type, morpheme))
+        for morpheme in old_entries.keys() - new_entries.keys():
+            changes['removed'].append((morpheme_type, morpheme))
+        for morpheme in new_entries.keys() & old_entries.keys():
+            if new_entries[morpheme] != old_entries[morpheme]:
+                changes['modified'].append((morpheme_type, morpheme))
+    
+    for kind in changes:
+        changes[kind].sort()
+    return changes
+
+def morpheme_notation(morpheme_type, morpheme):
+    """Write a morpheme the way the lexicon does, e.g. un-, -s or <in>"""
+    if morpheme_type == 'prefix':
+        return f'{morpheme}-'
+    if morpheme_type == 'suffix':
+        return f'-{morpheme}'
+    if morpheme_type == 'infix':
+        return f'<{morpheme}>'
+    if morpheme_type == 'circumfix':
+        return morpheme.replace('...', '-...-')
+    return morpheme
+
+def word_form_patterns(changes, old_lexicon, new_lexicon):
+    """Substrings a word form has to contain (all parts of one pattern) for a changed morpheme to alter it"""
+    infixes = {infix.lower() for lexicon in (old_lexicon, new_lexicon) for infix in lexicon['infixes']}
+    patterns = set()
+    for kind in changes.values():
+        for morpheme_type, morpheme in kind:
+            morpheme = morpheme.lower()
+            if not morpheme:
+                continue
+            if morpheme_type == 'circumfix':
+                # both parts have to show up
+                patterns.add(tuple(morpheme.split('...', 1)))
+                continue
+            patterns.add((morpheme,))
+            if morpheme_type == 'root':
+                # a root can also appear split by any infix
+                patterns.update((morpheme[:split] + infix + morpheme[split:],) for infix in infixes for split in range(1, len(morpheme)))
+    return sorted(patterns)
+
+def matching_word_forms(conn, project_id, patterns, chunk_size=100):
+    """A project's word forms containing every part of any pattern, filtered inside SQLite"""
+    word_forms = set()
+    for start in range(0, len(patterns), chunk_size):
+        chunk = patterns[start:start + chunk_size]
+        condition = ' OR '.join('(' + ' AND '.join(['instr(lower, ?) > 0'] * len(parts)) + ')' for parts in chunk)
+        word_forms.update(row['lower'] for row in conn.execute(
+            f'SELECT lower FROM word_forms WHERE project_id = ? AND ({condition})',
+            [project_id, *(part for parts in chunk for part in parts)]))
+    return word_forms
+
+def top_prediction(predictions, morpheme):
+    """The gloss a prediction contributes to the output, or None below the confidence threshold"""
+    candidates = predictions.get(morpheme)
+    if candidates and candidates[0]['confidence'] >= PREDICTION_MIN_CONFIDENCE:
+        return candidates[0]['gloss']
+    return None
+
+def select_in_chunks(conn, query, params, values, chunk_size=500):
+    """Run a query with an IN (...) list too long for one statement, a chunk at a time"""
+    rows = []
+    for start in range(0, len(values), chunk_size):
+        chunk = list(values[start:start + chunk_size])
+        rows.extend(conn.execute(query.format(placeholders=','.join('?' * len(chunk))), [*params, *chunk]))
+    return rows
+
+def affected_sentences(conn, project_id, lexicon_id, changes, old_lexicon, new_lexicon, max_sentence_id):
+    """Ids of the sentences up to max_sentence_id glossed with a lexicon whose output the changed morphemes could alter"""
+    patterns = word_form_patterns(changes, old_lexicon, new_lexicon)
+    if not patterns:
+        return set()
+    
+    if len(patterns) > RELEXICON_MAX_PATTERNS:
+        # many changed roots times many infixes, scanning the word forms would cost more than segmenting every sentence
+        return {row['id'] for row in conn.execute(
+            'SELECT id FROM sentences WHERE project_id = ? AND lexicon_id = ? AND id <= ?',
+            (project_id, lexicon_id, max_sentence_id))}
+    
+    # any word form containing a changed morpheme may now segment differently
+    word_forms = sorted(matching_word_forms(conn, project_id, patterns))
+    sentence_ids = {row['sentence_id'] for row in select_in_chunks(
+        conn,
+        'SELECT DISTINCT t.sentence_id FROM tokens t JOIN sentences s ON s.id = t.sentence_id '
+        'WHERE t.project_id = ? AND s.lexicon_id = ? AND s.id <= ? AND t.lower IN ({placeholders})',
+        [project_id, lexicon_id, max_sentence_id], word_forms)}
+    
+    # unknown roots are glossed by similarity to the whole lexicon, so their best guess can move too
+    unknown_roots = [row['morpheme'] for row in conn.execute(
+        "SELECT DISTINCT m.morpheme FROM morphemes m JOIN tokens t ON t.id = m.token_id JOIN sentences s ON s.id = t.sentence_id "
+        "WHERE m.project_id = ? AND s.lexicon_id = ? AND s.id <= ? AND m.type = 'root' AND (m.gloss IS NULL OR m.gloss LIKE '%?')",
+        (project_id, lexicon_id, max_sentence_id))
+        if row['morpheme'] not in old_lexicon['root_index'] and row['morpheme'] not in new_lexicon['root_index']]
+    if unknown_roots:
+        old_predictions = predict_glosses(old_lexicon, unknown_roots)
+        new_predictions = predict_glosses(new_lexicon, unknown_roots)
+        moved = [root for root in unknown_roots if top_prediction(old_predictions, root) != top_prediction(new_predictions, root)]
+        sentence_ids.update(row['sentence_id'] for row in select_in_chunks(
+            conn,
+            'SELECT DISTINCT t.sentence_id FROM morphemes m JOIN tokens t ON t.id = m.token_id JOIN sentences s ON s.id = t.sentence_id '
+            "WHERE m.project_id = ? AND s.lexicon_id = ? AND s.id <= ? AND m.type = 'root' AND m.morpheme IN ({placeholders})",
+            [project_id, lexicon_id, max_sentence_id], moved))
+    
+    return sentence_ids
+
+def token_changes(old_tokens, new_tokens):
+    """Tokens whose segmentation or gloss differ between two glossings of a sentence"""
+    changed = []
+    for position in range(max(len(old_tokens), len(new_tokens))):
+        old = old_tokens[position] if position < len(old_tokens) else None
+        new = new_tokens[position] if position < len(new_tokens) else None
+        old_pair = (old['segmented'], old['gloss']) if old else (None, None)
+        new_pair = (new['segmented'], new['gloss']) if new else (None, None)
+        if old_pair != new_pair:
+            changed.append({
+                'position': position,
+                'text': (new or old)['text'],
+                'segmented': [old_pair[0], new_pair[0]],
+                'gloss': [old_pair[1], new_pair[1]]
+            })
+    return changed
+
+def reglossed_sentences(conn, sentence_ids, lexicon):
+    """Segment stored sentences again with a lexicon, returning (sentence row, stored sentence) pairs"""
+    rows = select_in_chunks(conn, 'SELECT id, text, language, translation FROM sentences WHERE id IN ({placeholders})', [], sorted(sentence_ids))
+    
+    by_language = {}
+    for row in rows:
+        by_language.setdefault(row['language'] or 'en', []).append(row)
+    
+    reglossed = []
+    for language, language_rows in by_language.items():
+        nlp = get_spacy_model(language)
+        if not nlp:
+            raise RuntimeError('No SpaCy models available')
+        for row, doc in zip(language_rows, nlp.pipe([row['text'] for row in language_rows])):
+            context = build_analysis_context(row['text'], lexicon, nlp, language, doc=doc)
+            context['collect_tokens'] = True
+            # only the stored row is needed, not the response sections
+            context['fields'] = frozenset(['segmented'])
+            segment_one(context, row['translation'] is not None)
+            reglossed.append((row, stored_sentence(context)))
+    return reglossed
+
+def latest_project_lexicon(conn, project_id):
+    """Lexicon id of a project's most recently segmented sentence"""
+    row = conn.execute("SELECT lexicon_id FROM sentences WHERE project_id = ? AND source = 'segment' AND lexicon_id IS NOT NULL ORDER BY id DESC LIMIT 1", (project_id,)).fetchone()
+    return row['lexicon_id'] if row is not None else None
+
+def update_project_lexicon(project, project_id, old_lexicon, morphemes):
+    """Switch a project's segmented sentences to a new lexicon version, re-glossing only those it can change"""
+    conn = project_db()
+    lexicon_id = old_lexicon['id']
+    new_lexicon = register_lexicon(morphemes)
+    store_lexicon(new_lexicon['id'], new_lexicon['source'])
+    
+    changes = diff_lexicons(parse_morpheme_data(old_lexicon['source']), parse_morpheme_data(morphemes))
+    # re-glossing runs outside the write transaction, so only the sentences that exist now are
+    # checked and switched; anything stored meanwhile keeps the lexicon it was glossed with
+    max_sentence_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM sentences WHERE project_id = ?', (project_id,)).fetchone()[0]
+    candidates = affected_sentences(conn, project_id, lexicon_id, changes, old_lexicon, new_lexicon, max_sentence_id)
+    reglossed = reglossed_sentences(conn, candidates, new_lexicon)
+    
+    old_tokens = {}
+    for row in select_in_chunks(conn, 'SELECT sentence_id, text, segmented, gloss FROM tokens WHERE sentence_id IN ({placeholders}) ORDER BY sentence_id, position', [], sorted(candidates)):
+        old_tokens.setdefault(row['sentence_id'], []).append(row)
+    
+    sentence_changes = []
+    for row, sentence in reglossed:
+        tokens = token_changes(old_tokens.get(row['id'], []), sentence['tokens'])
+        if tokens:
+            sentence_changes.append({
+                'sentence_id': row['id'],
+                'text': row['text'],
+                'segmented': sentence['segmented'],
+                'translation': sentence['translation'],
+                'tokens': tokens
+            })
+    
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        # a concurrent update may already have moved some of them to another lexicon
+        current = {row['id'] for row in select_in_chunks(conn, 'SELECT id FROM sentences WHERE lexicon_id = ? AND id IN ({placeholders})',
+                                                          [lexicon_id], [row['id'] for row, _ in reglossed])}
+        reglossed = [(row, sentence) for row, sentence in reglossed if row['id'] in current]
+        sentence_changes = [change for change in sentence_changes if change['sentence_id'] in current]
+        delete_tokens(conn, [row['id'] for row, _ in reglossed])
+        conn.executemany('UPDATE sentences SET segmented = ?, translation = ? WHERE id = ?',
+                         [(sentence['segmented'], sentence['translation'], row['id']) for row, sentence in reglossed])
+        write_tokens(conn, project_id, [(row['id'], sentence['tokens']) for row, sentence in reglossed])
+        total = conn.execute('UPDATE sentences SET lexicon_id = ? WHERE project_id = ? AND lexicon_id = ? AND id <= ?',
+                             (new_lexicon['id'], project_id, lexicon_id, max_sentence_id)).rowcount
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    
+    return {
+        'project': project,
+        'lexicon_id': new_lexicon['id'],
+        'previous_lexicon_id': lexicon_id,
+        'morphemes': {kind: [morpheme_notation(*entry) for entry in entries] for kind, entries in changes.items()},
+        'sentences': total,
+        'checked': len(reglossed),
+        'changes': sentence_changes
+    }
+
+def concordance(project_id, filters, after=0, limit=CONCORDANCE_PAGE_SIZE):
+    """Tokens matching every filter, in corpus order after a token id, walking the most selective index"""
+    morpheme_filters = [(column, filters[key]) for key, column in [('morpheme', 'morpheme'), ('gloss', 'gloss'), ('type', 'type')] if filters.get(key)]
+    
+    # the driving table is scanned in token order through its index, so a page stops after `limit` hits
+    if filters.get('label'):
+        source = 'labels d JOIN tokens t ON t.id = d.token_id'
+        where = ['d.project_id = ?', 'd.label = ?', 'd.token_id > ?']
+        params = [project_id, filters['label'], after]
+        order = 'd.token_id'
+        if morpheme_filters:
+            where.append('EXISTS (SELECT 1 FROM morphemes m WHERE m.token_id = t.id AND ' + ' AND '.join(f'm.{column} = ?' for column, _ in morpheme_filters) + ')')
+            params.extend(value for _, value in morpheme_filters)
+    elif morpheme_filters:
+        source = 'morphemes d JOIN tokens t ON t.id = d.token_id'
+        where = ['d.project_id = ?', 'd.token_id > ?'] + [f'd.{column} = ?' for column, _ in morpheme_filters]
+        params = [project_id, after] + [value for _, value in morpheme_filters]
+        order = 'd.token_id'
+    else:
+        source = 'tokens t'
+        where = ['t.project_id = ?', 't.id > ?']
+        params = [project_id, after]
+        order = 't.id'
+    
+    if filters.get('word'):
+        where.append('t.lower = ?')
+        params.append(filters['word'].lower())
+    if filters.get('pos'):
+        where.append('t.pos = ?')
+        params.append(filters['pos'].upper())
+    
+    cursor = project_db().execute(
+        f'SELECT t.id, t.sentence_id, t.position, t.text, t.pos, t.lemma, t.segmented, t.gloss FROM {source} WHERE {" AND ".join(where)} ORDER BY {order}',
+        params
+    )
+    
+    hits = []
+    for row in cursor:
+        # a token with two matching morphemes comes up twice in a row
+        if hits and hits[-1]['token_id'] == row['id']:
+            continue
+        if len(hits) == limit:
+            return hits, True
+        hits.append({
+            'token_id': row['id'],
+            'sentence_id': row['sentence_id'],
+            'position': row['position'],
+            'text': row['text'],
+            'pos': row['pos'],
+            'lemma': row['lemma'],
+            'segmented': row['segmented'],
+            'gloss': row['gloss']
+        })
+    return hits, False
+
+def attach_concordance_context(hits):
+    """Add each hit's sentence and morphemes with one query per table"""
+    if not hits:
+        return hits
+    
+    conn = project_db()
+    sentence_ids = sorted({hit['sentence_id'] for hit in hits})
+    token_ids = [hit['token_id'] for hit in hits]
+    
+    sentences = {
+        row['id']: row for row in conn.execute(
+            f'SELECT id, text, segmented, translation FROM sentences WHERE id IN ({",".join("?" * len(sentence_ids))})', sentence_ids)
+    }
+    morphemes = {}
+    for row in conn.execute(
+            f'SELECT token_id, morpheme, type, gloss FROM morphemes WHERE token_id IN ({",".join("?" * len(token_ids))}) ORDER BY token_id, position', token_ids):
+        morphemes.setdefault(row['token_id'], []).append({'morpheme': row['morpheme'], 'type': row['type'], 'gloss': row['gloss']})
+    labels = {}
+    for row in conn.execute(f'SELECT token_id, label FROM labels WHERE token_id IN ({",".join("?" * len(token_ids))})', token_ids):
+        labels.setdefault(row['token_id'], []).append(row['label'])
+    
+    for hit in hits:
+        sentence = sentences[hit['sentence_id']]
+        hit['sentence'] = {'text': sentence['text'], 'segmented': sentence['segmented'], 'translation': sentence['translation']}
+        hit['morphemes'] = morphemes.get(hit['token_id'], [])
+        hit['labels'] = labels.get(hit['token_id'], [])
+    return hits
+
+def store_requested(data, form=False):
+    """Project a request asks its results to be stored under, or None; form fields are strings, so parse them as flags"""
+    if not (form_flag('store') if form else data.get('store')):
+        return None
+    return str(data.get('project') or 'default')
+
+@app.route('/projects/<project>/concordance', methods=['GET'])
+def project_concordance(project):
+    """Paginated concordance search, e.g. ?label=PL or ?type=root&gloss=go"""
+    try:
+        filters = {key: request.args.get(key, '').strip() for key in ('morpheme', 'gloss', 'type', 'label', 'word', 'pos')}
+        # accept labels written as affixes or clitics, e.g. -PL or =DEF
+        filters['label'] = filters['label'].lstrip('-=.').upper()
+        filters['morpheme'] = filters['morpheme'].strip('-').lower()
+        after = max(0, int(request.args.get('after', 0)))
+        limit = max(1, min(int(request.args.get('limit', CONCORDANCE_PAGE_SIZE)), CONCORDANCE_MAX_PAGE_SIZE))
+        
+        conn = project_db()
+        project_id = project_id_for(conn, project)
+        if project_id is None:
+            return jsonify({'error': 'Unknown project'}), 404
+        
+        with stage('query'):
+            hits, more = concordance(project_id, filters, after, limit)
+            attach_concordance_context(hits)
+        
+        return jsonify({
+            'project': project,
+            'filters': {key: value for key, value in filters.items() if value},
+            'results': hits,
+            'next_after': hits[-1]['token_id'] if more else None
+        })
+    
+    except ValueError:
+        return jsonify({'error': 'after and limit must be integers'}), 400
+    
+    except Exception as e:
+        return jsonify({'error': str(e)})
+
+@app.route('/projects/<project>', methods=['GET'])
+def project_summary(project):
+    """Sentence, token and morpheme counts for a stored project"""
+    try:
+        conn = project_db()
+        project_id = project_id_for(conn, project)
+        if project_id is None:
+            return jsonify({'error': 'Unknown project'}), 404
+        
+        counts = {
+            table: conn.execute(f'SELECT COUNT(*) FROM {table} WHERE project_id = ?', (project_id,)).fetchone()[0]
+            for table in ('sentences', 'tokens', 'morphemes')
         }
+        return jsonify({'project': project, **counts})
+    
+    except Exception as e:
+        return jsonify({'error': str(e)})
+
+@app.route('/projects/<project>/lexicon', methods=['POST'])
+def project_lexicon(project):
+    """Apply an edited lexicon to a project and return what changed"""
+    try:
+        data = request.json
+        morphemes = data.get('morphemes', '').strip()
+        if not morphemes:
+            return jsonify({'error': 'Morphemes are required'})
+        
+        conn = project_db()
+        project_id = project_id_for(conn, project)
+        if project_id is None:
+            return jsonify({'error': 'Unknown project'}), 404
         
-        if pseudo_translation:
-            response_data['pseudo_translation'] = pseudo_translation
+        lexicon_id = data.get('lexicon_id') or latest_project_lexicon(conn, project_id)
+        old_lexicon = get_lexicon(lexicon_id) if lexicon_id else None
+        if old_lexicon is None:
+            return jsonify({'error': 'The project has no stored lexicon to compare against'}), 409
         
-        return jsonify(response_data)
+        with stage('relexicon'):
+            change_set = update_project_lexicon(project, project_id, old_lexicon, morphemes)
         
+        return jsonify(change_set)
+    
+    except RequestEntityTooLarge:
+        raise
+    
     except Exception as e:
         return jsonify({'error': str(e)})
+
+def upload_error(files):
+    """Validate an audio upload, returning an error message or None"""
+    if 'file' not in files:
+        return 'No file uploaded'
+    
+    file = files['file']
+    if file.filename == '':
+        return 'No file selected'
+    
+    if not allowed_file(file.filename):
+        return 'File type not supported'
+    
+    return None
+
+def ingest_upload(file):
+    """Hash a spooled upload in place and take over its buffer, returning its safe filename, buffer and hash"""
+    filename = secure_filename(file.filename)
+    stream = file.stream
+    # werkzeug closes request files once the request ends, swap in a placeholder so jobs and streams keep the buffer
+    file.stream = io.BytesIO()
+    
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: stream.read(1024 * 1024), b''):
+        digest.update(chunk)
+    stream.seek(0)
+    
+    return filename, stream, digest.hexdigest()
+
+def load_upload_audio(stream):
+    """Decode an upload buffer straight into the 16 kHz array Whisper consumes"""
+    from faster_whisper import decode_audio
+    
+    return decode_audio(stream, sampling_rate=SAMPLE_RATE)
+
+def segment_dict(segment):
+    """JSON-friendly view of a decoded Whisper segment"""
+    return {'start': segment.start, 'end': segment.end, 'text': segment.text}
+
+TRANSCRIPTION_CACHE_LOCK = threading.Lock()
+TRANSCRIPTION_CACHE_STATS = {'hits': 0, 'misses': 0}
+# separate from the eviction lock, so lookups never wait on a cache directory sweep
+TRANSCRIPTION_STATS_LOCK = threading.Lock()
+
+def count_transcription_cache(outcome):
+    """Count a transcription cache hit or miss; requests and job threads look up concurrently"""
+    with TRANSCRIPTION_STATS_LOCK:
+        TRANSCRIPTION_CACHE_STATS[outcome] += 1
+
+def transcription_cache_stats():
+    """Snapshot of the transcription cache counters"""
+    with TRANSCRIPTION_STATS_LOCK:
+        return dict(TRANSCRIPTION_CACHE_STATS)
+
+def transcription_cache_key(audio_hash, beam_size, long_audio=False):
+    """Cache key covering the audio and every parameter that changes the transcript"""
+    params = f'{audio_hash}|{WHISPER_MODEL_SIZE}|{WHISPER_DEVICE}|{WHISPER_COMPUTE_TYPE}|{beam_size}|{int(long_audio)}'
+    return hashlib.sha256(params.encode('utf-8')).hexdigest()
+
+def load_cached_transcription(key):
+    """Return a cached transcription, or None on a miss"""
+    path = os.path.join(TRANSCRIPTION_CACHE_DIR, key + '.json')
+    try:
+        with open(path, encoding='utf-8') as cache_file:
+            result = json.load(cache_file)
+        # bump the modification time, eviction drops the least recently used entries first
+        os.utime(path)
+    except (OSError, ValueError):
+        count_transcription_cache('misses')
+        return None
+    
+    count_transcription_cache('hits')
+    return result
+
+def store_cached_transcription(key, result):
+    """Write a transcription to the cache and trim the cache back under its size cap"""
+    os.makedirs(TRANSCRIPTION_CACHE_DIR, exist_ok=True)
+    path = os.path.join(TRANSCRIPTION_CACHE_DIR, key + '.json')
+    temp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+    
+    with open(temp_path, 'w', encoding='utf-8') as cache_file:
+        json.dump(result, cache_file)
+    os.replace(temp_path, path)
+    
+    with TRANSCRIPTION_CACHE_LOCK:
+        entries = []
+        for name in os.listdir(TRANSCRIPTION_CACHE_DIR):
+            if not name.endswith('.json'):
+                continue
+            try:
+                stat = os.stat(os.path.join(TRANSCRIPTION_CACHE_DIR, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
         
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= TRANSCRIPTION_CACHE_MB * 1024 * 1024:
+                break
+            try:
+                os.unlink(os.path.join(TRANSCRIPTION_CACHE_DIR, name))
+            except OSError:
+                pass
+            total -= size
+
+def form_flag(name):
+    """Read a boolean form field such as long_audio=true"""
+    return request.form.get(name, '').strip().lower() in ('1', 'true', 'yes', 'on')
+
+def split_at_silences(audio, max_chunk_seconds=LONG_AUDIO_CHUNK_SECONDS):
+    """Group voice-activity spans into chunks of at most max_chunk_seconds, cutting only in silences"""
+    from faster_whisper.vad import VadOptions, get_speech_timestamps
+    
+    vad_options = VadOptions(min_silence_duration_ms=LONG_AUDIO_MIN_SILENCE_MS, max_speech_duration_s=max_chunk_seconds)
+    max_samples = int(max_chunk_seconds * SAMPLE_RATE)
+    
+    chunks = []
+    for span in get_speech_timestamps(audio, vad_options):
+        if chunks and span['end'] - chunks[-1][0] <= max_samples:
+            chunks[-1][1] = span['end']
+        else:
+            chunks.append([span['start'], span['end']])
+    
+    if not chunks:
+        # VAD can miss quiet or noisy speech entirely, let Whisper see the whole recording in fixed windows
+        return [(start, min(start + max_samples, len(audio))) for start in range(0, len(audio), max_samples)]
+    
+    return [(start, end) for start, end in chunks]
+
+LONG_AUDIO_EXECUTOR = None
+LONG_AUDIO_LOCK = threading.Lock()
+CHUNK_WORKER_MODEL = None
+
+def init_chunk_worker():
+    """Load one single-threaded Whisper model per worker process"""
+    global CHUNK_WORKER_MODEL
+    from faster_whisper import WhisperModel
+    
+    CHUNK_WORKER_MODEL = WhisperModel(
+        WHISPER_MODEL_SIZE,
+        device=WHISPER_DEVICE,
+        compute_type=WHISPER_COMPUTE_TYPE,
+        cpu_threads=LONG_AUDIO_THREADS,
+        num_workers=1
+    )
+
+def transcribe_chunk(audio, offset, beam_size):
+    """Transcribe one chunk in a worker process, shifting its timestamps by the chunk offset"""
+    segments, _ = CHUNK_WORKER_MODEL.transcribe(audio, beam_size=beam_size)
+    return [{'start': offset + segment.start, 'end': offset + segment.end, 'text': segment.text} for segment in segments]
+
+def get_long_audio_executor():
+    """Start the chunk worker processes on first use"""
+    global LONG_AUDIO_EXECUTOR
+    with LONG_AUDIO_LOCK:
+        if LONG_AUDIO_EXECUTOR is None:
+            # spawn rather than fork, CTranslate2 threads do not survive a fork
+            LONG_AUDIO_EXECUTOR = ProcessPoolExecutor(
+                max_workers=LONG_AUDIO_PROCESSES,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=init_chunk_worker
+            )
+        return LONG_AUDIO_EXECUTOR
+
+def transcribe_long_audio(audio, beam_size):
+    """Split a decoded recording at silences, transcribe the chunks in parallel and stitch them back in time order"""
+    chunks = split_at_silences(audio)
+    
+    executor = get_long_audio_executor()
+    futures = [executor.submit(transcribe_chunk, audio[start:end], start / SAMPLE_RATE, beam_size) for start, end in chunks]
+    
+    segments = []
+    for future in futures:
+        segments.extend(future.result())
+    
+    return segments, len(chunks), len(audio) / SAMPLE_RATE
+
 @app.route('/transcribe', methods=['POST'])
 def transcribe():
     try:
-        if 'file' not in request.files:
-            return jsonify({'success': False, 'error': 'No file uploaded'})
+        error = upload_error(request.files)
+        if error:
+            return jsonify({'success': False, 'error': error})
         
-        file = request.files['file']
-        if file.filename == '':
-            return jsonify({'success': False, 'error': 'No file selected'})
+        beam_size = parse_beam_size(request.form.get('beam_size'))
+        long_audio = form_flag('long_audio')
+        with stage('ingest'):
+            filename, upload, audio_hash = ingest_upload(request.files['file'])
         
-        if not allowed_file(file.filename):
-            return jsonify({'success': False, 'error': 'File type not supported'})
+        try:
+            cache_key = transcription_cache_key(audio_hash, beam_size, long_audio)
+            with stage('cache'):
+                cached = load_cached_transcription(cache_key)
+            if cached is not None:
+                return jsonify({
+                    'success': True,
+                    'transcription': cached['transcription'],
+                    'filename': filename,
+                    'segments': cached['segments'],
+                    'cached': True
+                })
+            
+            print(f"Transcribing file: {filename}")
+            with stage('decode'):
+                audio = load_upload_audio(upload)
+            
+            response_data = {}
+            with stage('transcribe'):
+                if long_audio:
+                    segments, chunk_count, duration = transcribe_long_audio(audio, beam_size)
+                    response_data['chunks'] = chunk_count
+                else:
+                    with whisper_model() as model:
+                        decoded, info = model.transcribe(audio, beam_size=beam_size)
+                        segments = [segment_dict(segment) for segment in decoded]
+                    duration = info.duration
+            
+            transcription = " ".join([segment['text'] for segment in segments]).strip()
+            # an empty long-audio transcript usually means the chunking missed the speech, don't pin it in the cache
+            if transcription or not long_audio:
+                with stage('cache'):
+                    store_cached_transcription(cache_key, {
+                        'transcription': transcription,
+                        'segments': segments,
+                        'duration': duration
+                    })
+            
+            response_data.update({
+                'success': True,
+                'transcription': transcription,
+                'filename': filename,
+                'segments': segments
+            })
+            with stage('serialize'):
+                return jsonify(response_data)
         
-        filename = secure_filename(file.filename)
-        with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(filename)[1]) as temp_file:
-            file.save(temp_file.name)
-            temp_path = temp_file.name
+        finally:
+            upload.close()
+    
+    except RequestEntityTooLarge:
+        raise
+    
+    except Exception as e:
+        print(f"Error during transcription: {str(e)}")
+        return jsonify({'success': False, 'error': f'Transcription failed: {str(e)}'})
+
+@app.route('/transcribe/stream', methods=['POST'])
+def transcribe_stream():
+    """Stream each transcribed segment as a line of NDJSON as soon as it is decoded"""
+    try:
+        error = upload_error(request.files)
+        if error:
+            return jsonify({'success': False, 'error': error})
         
+        beam_size = parse_beam_size(request.form.get('beam_size'))
+        filename, upload, audio_hash = ingest_upload(request.files['file'])
+    
+    except RequestEntityTooLarge:
+        raise
+    
+    except Exception as e:
+        return jsonify({'success': False, 'error': f'Transcription failed: {str(e)}'})
+    
+    def generate():
         try:
-            print(f"Transcribing file: {filename}")
-            segments, info = model.transcribe(temp_path, beam_size=5)
-            transcription = " ".join([segment.text for segment in segments]).strip()
+            cache_key = transcription_cache_key(audio_hash, beam_size)
+            cached = load_cached_transcription(cache_key)
             
-            return jsonify({
+            if cached is not None:
+                # replay the cached segments so streaming clients see the same events
+                yield json.dumps({'type': 'info', 'filename': filename, 'duration': cached['duration'], 'language': cached.get('language'), 'cached': True}) + '\n'
+                for segment in cached['segments']:
+                    yield json.dumps({'type': 'segment', **segment}) + '\n'
+                transcription = cached['transcription']
+            
+            else:
+                print(f"Transcribing file: {filename}")
+                # the model stays checked out until the lazy segment generator is exhausted
+                audio = load_upload_audio(upload)
+                with whisper_model() as model:
+                    decoded, info = model.transcribe(audio, beam_size=beam_size)
+                    yield json.dumps({'type': 'info', 'filename': filename, 'duration': info.duration, 'language': info.language}) + '\n'
+                    
+                    segments = []
+                    for segment in decoded:
+                        segments.append(segment_dict(segment))
+                        yield json.dumps({'type': 'segment', **segments[-1]}) + '\n'
+                
+                transcription = " ".join([segment['text'] for segment in segments]).strip()
+                store_cached_transcription(cache_key, {
+                    'transcription': transcription,
+                    'segments': segments,
+                    'duration': info.duration,
+                    'language': info.language
+                })
+            
+            yield json.dumps({
+                'type': 'done',
                 'success': True,
                 'transcription': transcription,
                 'filename': filename
-            })
+            }) + '\n'
+        
+        except Exception as e:
+            print(f"Error during transcription: {str(e)}")
+            yield json.dumps({'type': 'error', 'success': False, 'error': f'Transcription failed: {str(e)}'}) + '\n'
         
         finally:
-            if os.path.exists(temp_path):
-                os.unlink(temp_path)
+            # also runs when the client disconnects and the generator is closed
+            upload.close()
+    
+    return Response(generate(), mimetype='application/x-ndjson', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+TRANSCRIPTION_JOBS = {}
+PENDING_JOBS = []
+JOBS_LOCK = threading.Lock()
+TRANSCRIPTION_EXECUTOR = None
+
+def get_transcription_executor():
+    """Start the background transcription worker pool on first use"""
+    global TRANSCRIPTION_EXECUTOR
+    with JOBS_LOCK:
+        if TRANSCRIPTION_EXECUTOR is None:
+            TRANSCRIPTION_EXECUTOR = ThreadPoolExecutor(max_workers=TRANSCRIBE_WORKERS, thread_name_prefix='transcribe')
+        return TRANSCRIPTION_EXECUTOR
+
+def prune_transcription_jobs():
+    """Forget finished jobs older than the retention window (caller holds JOBS_LOCK)"""
+    cutoff = time.time() - TRANSCRIBE_JOB_TTL
+    for job_id, job in list(TRANSCRIPTION_JOBS.items()):
+        if job['finished'] and job['finished'] < cutoff:
+            del TRANSCRIPTION_JOBS[job_id]
+
+def run_transcription_job(job_id):
+    """Transcribe a queued upload, recording progress as segments are decoded"""
+    job = TRANSCRIPTION_JOBS[job_id]
+    with JOBS_LOCK:
+        PENDING_JOBS.remove(job_id)
+        job['status'] = 'running'
+        job['started'] = time.time()
+    
+    try:
+        cache_key = transcription_cache_key(job['audio_hash'], job['beam_size'])
+        cached = load_cached_transcription(cache_key)
+        
+        if cached is None:
+            print(f"Transcribing file: {job['filename']}")
+            with whisper_model() as model:
+                decoded, info = model.transcribe(load_upload_audio(job['upload']), beam_size=job['beam_size'])
+                job['duration'] = info.duration
+                
+                segments = []
+                for segment in decoded:
+                    segments.append(segment_dict(segment))
+                    job['processed'] = segment.end
+            
+            cached = {
+                'transcription': " ".join([segment['text'] for segment in segments]).strip(),
+                'segments': segments,
+                'duration': info.duration,
+                'language': info.language
+            }
+            store_cached_transcription(cache_key, cached)
+        
+        job['duration'] = cached['duration']
+        job['transcription'] = cached['transcription']
+        job['processed'] = cached['duration']
+        job['status'] = 'done'
     
     except Exception as e:
         print(f"Error during transcription: {str(e)}")
+        job['error'] = f'Transcription failed: {str(e)}'
+        job['status'] = 'error'
+    
+    finally:
+        job['finished'] = time.time()
+        job['upload'].close()
+        job['upload'] = None
+
+def transcription_job_status(job):
+    """Public view of a job's progress"""
+    status = {
+        'job_id': job['id'],
+        'status': job['status'],
+        'filename': job['filename'],
+        'duration': job['duration'],
+        'processed': job['processed'],
+        'progress': min(job['processed'] / job['duration'], 1.0) if job['duration'] else 0.0
+    }
+    
+    if job['status'] == 'queued':
+        status['queue_position'] = PENDING_JOBS.index(job['id']) + 1
+    if job['error']:
+        status['error'] = job['error']
+    
+    return status
+
+@app.route('/transcribe/jobs', methods=['POST'])
+def submit_transcription_job():
+    try:
+        error = upload_error(request.files)
+        if error:
+            return jsonify({'success': False, 'error': error})
+        
+        beam_size = parse_beam_size(request.form.get('beam_size'))
+        job_id = uuid.uuid4().hex
+        job = {
+            'id': job_id,
+            'filename': None,
+            'upload': None,
+            'audio_hash': None,
+            'beam_size': beam_size,
+            # holds a queue slot while the upload is read, so concurrent submits can't overfill the queue
+            'status': 'uploading',
+            'submitted': time.time(),
+            'started': None,
+            'finished': None,
+            'duration': None,
+            'processed': 0.0,
+            'transcription': None,
+            'error': None
+        }
+        
+        with JOBS_LOCK:
+            prune_transcription_jobs()
+            active = len([job for job in TRANSCRIPTION_JOBS.values() if job['status'] in ('uploading', 'queued', 'running')])
+            if active < TRANSCRIBE_QUEUE_DEPTH:
+                TRANSCRIPTION_JOBS[job_id] = job
+        
+        if active >= TRANSCRIBE_QUEUE_DEPTH:
+            response = jsonify({'success': False, 'error': 'Transcription queue is full, please try again later'})
+            response.headers['Retry-After'] = '30'
+            return response, 429
+        
+        try:
+            filename, upload, audio_hash = ingest_upload(request.files['file'])
+        except BaseException:
+            with JOBS_LOCK:
+                del TRANSCRIPTION_JOBS[job_id]
+            raise
+        
+        with JOBS_LOCK:
+            job.update(filename=filename, upload=upload, audio_hash=audio_hash, status='queued')
+            PENDING_JOBS.append(job_id)
+        
+        get_transcription_executor().submit(run_transcription_job, job_id)
+        
+        with JOBS_LOCK:
+            status = transcription_job_status(job)
+        
+        return jsonify({'success': True, **status}), 202
+    
+    except RequestEntityTooLarge:
+        raise
+    
+    except Exception as e:
         return jsonify({'success': False, 'error': f'Transcription failed: {str(e)}'})
+
+@app.route('/transcribe/jobs/<job_id>', methods=['GET'])
+def transcription_job(job_id):
+    with JOBS_LOCK:
+        job = TRANSCRIPTION_JOBS.get(job_id)
+        if job is None:
+            return jsonify({'success': False, 'error': 'Unknown job'}), 404
+        status = transcription_job_status(job)
+    
+    return jsonify({'success': True, **status})
+
+@app.route('/transcribe/jobs/<job_id>/result', methods=['GET'])
+def transcription_job_result(job_id):
+    with JOBS_LOCK:
+        job = TRANSCRIPTION_JOBS.get(job_id)
+        if job is None:
+            return jsonify({'success': False, 'error': 'Unknown job'}), 404
+        status, error, transcription, filename = job['status'], job['error'], job['transcription'], job['filename']
+    
+    if status == 'error':
+        return jsonify({'success': False, 'error': error})
+    
+    if status != 'done':
+        return jsonify({'success': False, 'status': status, 'error': 'Transcription is not finished yet'}), 409
+    
+    return jsonify({
+        'success': True,
+        'transcription': transcription,
+        'filename': filename
+    })
     
 @app.route('/manual_gloss', methods=['POST'])
 def manual_gloss():
@@ -548,26 +3045,138 @@ def manual_gloss():
         if not text or not word_breakdown:
             return jsonify({'error': 'Both text and word breakdown are required'})
         
-        custom_abbrevs = {}
-        if gloss_abbreviations:
-            for line in gloss_abbreviations.strip().split('\n'):
-                if '=' in line:
-                    key, value = line.split('=', 1)
-                    custom_abbrevs[key.strip().lower()] = value.strip().upper()
+        with stage('compile'):
+            compiled = get_compiled_breakdown(word_breakdown, gloss_abbreviations)
         
-        abbreviations = generate_abbreviations()
-        abbreviations.update(custom_abbrevs)
+        with stage('gloss'):
+            result = gloss_with_breakdown(text, compiled)
         
-        result = process_manual_glossing(text, word_breakdown, abbreviations)
+        store_project = store_requested(data)
+        if store_project:
+            with stage('store'):
+                result['sentence_id'] = store_sentences(store_project, [manual_stored_sentence(result, compiled)], 'manual')[0]
         
-        return jsonify(result)
+        with stage('serialize'):
+            return jsonify(result)
         
+    except RequestEntityTooLarge:
+        raise
+    
     except Exception as e:
         return jsonify({'error': str(e)})
 
-def process_manual_glossing(text, word_breakdown, abbreviations):
-    """Process manual glossing without SpaCy dependency"""
-    words = text.split()
+def manual_stored_sentence(result, compiled):
+    """Project store row for one manually glossed text"""
+    return {
+        'text': result['original'],
+        'segmented': result['morpheme_breakdown'],
+        'translation': result['glossed'],
+        'tokens': manual_token_records(result['original'], compiled)
+    }
+
+def manual_gloss_lines(upload):
+    """Yield the non-empty lines of an uploaded text file one at a time"""
+    reader = io.TextIOWrapper(upload, encoding='utf-8', errors='replace')
+    for line in reader:
+        line = line.strip()
+        if line:
+            yield line
+
+@app.route('/manual_gloss_batch', methods=['POST'])
+def manual_gloss_batch():
+    """Gloss many texts against one compiled breakdown, as one JSON response or streamed as NDJSON"""
+    upload = None
+    try:
+        if request.files.get('text_file'):
+            # a transcript file is always streamed, one line at a time
+            data = request.form
+            text_file = request.files['text_file']
+            upload = text_file.stream
+            # detach the buffer so it outlives the request while the response streams
+            text_file.stream = io.BytesIO()
+            texts = manual_gloss_lines(upload)
+            stream = True
+        else:
+            data = request.json
+            texts = data.get('texts')
+            stream = bool(data.get('stream', False))
+            if not isinstance(texts, list) or not texts:
+                return jsonify({'error': 'A list of texts or a text_file is required'})
+        
+        word_breakdown = data.get('word_breakdown', '').strip()
+        gloss_abbreviations = data.get('gloss_abbreviations', '').strip()
+        if not word_breakdown:
+            if upload is not None:
+                upload.close()
+            return jsonify({'error': 'A word breakdown is required'})
+        
+        with stage('compile'):
+            compiled = get_compiled_breakdown(word_breakdown, gloss_abbreviations)
+        
+        store_project = store_requested(data, form=upload is not None)
+    
+    except RequestEntityTooLarge:
+        raise
+    
+    except Exception as e:
+        if upload is not None:
+            upload.close()
+        return jsonify({'error': str(e)})
+    
+    def gloss_item(index, text):
+        if not isinstance(text, str) or not text.strip():
+            return {'index': index, 'error': 'Text is required'}
+        return {'index': index, **gloss_with_breakdown(text.strip(), compiled)}
+    
+    if not stream:
+        with stage('gloss'):
+            results = [gloss_item(index, text) for index, text in enumerate(texts)]
+        if store_project:
+            with stage('store'):
+                stored = [result for result in results if 'error' not in result]
+                sentence_ids = store_sentences(store_project, [manual_stored_sentence(result, compiled) for result in stored], 'manual')
+                for result, sentence_id in zip(stored, sentence_ids):
+                    result['sentence_id'] = sentence_id
+        with stage('serialize'):
+            return jsonify({
+                'results': results,
+                'errors': len([result for result in results if 'error' in result])
+            })
+    
+    def generate():
+        count = 0
+        errors = 0
+        pending = []
+        try:
+            for index, text in enumerate(texts):
+                result = gloss_item(index, text)
+                count += 1
+                errors += 'error' in result
+                if store_project and 'error' not in result:
+                    # stored in chunks so memory stays flat however long the transcript is
+                    pending.append(manual_stored_sentence(result, compiled))
+                    if len(pending) >= STORE_CHUNK_SIZE:
+                        store_sentences(store_project, pending, 'manual')
+                        pending = []
+                yield json.dumps({'type': 'gloss', **result}) + '\n'
+            if pending:
+                store_sentences(store_project, pending, 'manual')
+            yield json.dumps({'type': 'done', 'count': count, 'errors': errors}) + '\n'
+        
+        except Exception as e:
+            yield json.dumps({'type': 'error', 'error': str(e)}) + '\n'
+        
+        finally:
+            if upload is not None:
+                upload.close()
+    
+    return Response(generate(), mimetype='application/x-ndjson', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+def parse_word_breakdown(word_breakdown):
+    """Parse 'word: key=value, ...' breakdown lines into a feature dict per lowercased word"""
     word_data = {}
     
     for line in word_breakdown.strip().split('\n'):
@@ -586,62 +3195,82 @@ def process_manual_glossing(text, word_breakdown, abbreviations):
         
         word_data[word] = features
     
-    morpheme_breakdown = []
-    glossed_words = []
-    
-    
-    for word in words:
-        word_lower = word.lower()
+    return word_data
+
+def render_word_breakdown(word_lower, features, abbreviations):
+    """Render one breakdown entry as its (morpheme breakdown, gloss, morpheme records) triple"""
+    root_part = features.get('root', word_lower)
+    prefixes = []
+    suffixes = []
+    grammatical_features = []
+
+    for key, value in features.items():
+        if key == 'root':
+            continue  # already handled
+        elif key in ['prefix', 'prefix1', 'prefix2']:
+            prefixes.append(value)
+        elif key in ['suffix', 'suffix1', 'suffix2']:
+            suffixes.append(value)
+        else:
+            abbrev = abbreviations.get(value.lower())
+            if abbrev:
+                grammatical_features.append(abbrev)
+            else:
+                grammatical_features.append(value.upper())
+
+    morpheme_parts = []
+    if prefixes:
+        morpheme_parts.extend([f"{prefix}-" for prefix in prefixes])
+    morpheme_parts.append(root_part)
+    if suffixes:
+        morpheme_parts.extend([f"-{suffix}" for suffix in suffixes])
+
+    gloss_parts = []
+    if prefixes:
+        gloss_parts.extend([prefix.upper() for prefix in prefixes])
         
-        if word_lower in word_data:
-            features = word_data[word_lower]
-            
-            morpheme_parts = []
-            gloss_parts = []
-            
-            root_part = features.get('root', word_lower)
-            prefixes = []
-            suffixes = []
-            grammatical_features = []
+    root_gloss = root_part.upper()
+    if grammatical_features:
+        root_gloss += '.' + '.'.join(grammatical_features)
+    gloss_parts.append(root_gloss)
 
-            for key, value in features.items():
-                if key == 'root':
-                    continue  # already handled
-                elif key in ['prefix', 'prefix1', 'prefix2']:
-                    prefixes.append(value)
-                elif key in ['suffix', 'suffix1', 'suffix2']:
-                    suffixes.append(value)
-                else:
-                    abbrev = abbreviations.get(value.lower())
-                    if abbrev:
-                        grammatical_features.append(abbrev)
-                    else:
-                        grammatical_features.append(value.upper())
-
-            morpheme_parts = []
-            if prefixes:
-                morpheme_parts.extend([f"{prefix}-" for prefix in prefixes])
-            morpheme_parts.append(root_part)
-            if suffixes:
-                morpheme_parts.extend([f"-{suffix}" for suffix in suffixes])
-
-            gloss_parts = []
-            if prefixes:
-                gloss_parts.extend([prefix.upper() for prefix in prefixes])
-                
-            root_gloss = root_part.upper()
-            if grammatical_features:
-                root_gloss += '.' + '.'.join(grammatical_features)
-            gloss_parts.append(root_gloss)
+    if suffixes:
+        gloss_parts.extend([suffix.upper() for suffix in suffixes])
 
-            if suffixes:
-                gloss_parts.extend([suffix.upper() for suffix in suffixes])
+    morphemes = [{'morpheme': prefix, 'type': 'prefix', 'gloss': prefix.upper(), 'labels': []} for prefix in prefixes]
+    morphemes.append({'morpheme': root_part, 'type': 'root', 'gloss': root_part.upper(), 'labels': grammatical_features})
+    morphemes.extend({'morpheme': suffix, 'type': 'suffix', 'gloss': suffix.upper(), 'labels': []} for suffix in suffixes)
 
-            morpheme_breakdown.append(''.join(morpheme_parts))
-            glossed_words.append('-'.join(gloss_parts))
-            
-            #morpheme_breakdown.append(''.join(morpheme_parts))
-            #glossed_words.append('.'.join(gloss_parts))
+    return ''.join(morpheme_parts), '-'.join(gloss_parts), morphemes
+
+def compile_word_breakdown(word_breakdown, abbreviations):
+    """Pre-render every breakdown entry once, so glossing a text is one dict lookup per word"""
+    return {
+        word: render_word_breakdown(word, features, abbreviations)
+        for word, features in parse_word_breakdown(word_breakdown).items()
+    }
+
+BREAKDOWN_CACHE = LRUCache(64)
+
+def get_compiled_breakdown(word_breakdown, gloss_abbreviations=''):
+    """Compiled breakdown for a breakdown text and abbreviation set, cached by their hash"""
+    key = hashlib.sha256(f'{word_breakdown.strip()}\0{gloss_abbreviations.strip()}'.encode('utf-8')).hexdigest()
+    compiled = BREAKDOWN_CACHE.get(key)
+    if compiled is None:
+        compiled = compile_word_breakdown(word_breakdown, get_gloss_renderer(gloss_abbreviations).abbreviations)
+        BREAKDOWN_CACHE.put(key, compiled)
+    return compiled
+
+def gloss_with_breakdown(text, compiled):
+    """Gloss one text against a compiled breakdown; unknown words pass through uppercased"""
+    morpheme_breakdown = []
+    glossed_words = []
+    
+    for word in text.split():
+        entry = compiled.get(word.lower())
+        if entry is not None:
+            morpheme_breakdown.append(entry[0])
+            glossed_words.append(entry[1])
         else:
             morpheme_breakdown.append(word)
             glossed_words.append(word.upper())
@@ -652,6 +3281,132 @@ def process_manual_glossing(text, word_breakdown, abbreviations):
         'glossed': ' '.join(glossed_words)
     }
 
+def manual_token_records(text, compiled):
+    """Store rows for the words of a manually glossed text"""
+    records = []
+    for word in text.split():
+        entry = compiled.get(word.lower())
+        if entry is not None:
+            labels = [label for morpheme in entry[2] for label in morpheme['labels']]
+            records.append({'text': word, 'pos': None, 'lemma': None, 'segmented': entry[0], 'gloss': entry[1], 'labels': labels, 'morphemes': entry[2]})
+        else:
+            records.append({'text': word, 'pos': None, 'lemma': None, 'segmented': word, 'gloss': word.upper(), 'labels': [], 'morphemes': []})
+    return records
+
+def process_manual_glossing(text, word_breakdown, abbreviations):
+    """Process manual glossing without SpaCy dependency"""
+    return gloss_with_breakdown(text, compile_word_breakdown(word_breakdown, abbreviations))
+
+# imported on first use so the server starts, and serves / and /manual_gloss, without them
+HEAVY_MODULES = ['numpy', 'sklearn.feature_extraction.text', 'sklearn.metrics.pairwise', 'langdetect', 'spacy', 'faster_whisper', 'faster_whisper.vad']
+
+MODELS_READY = threading.Event()
+PRELOAD_LOCK = threading.Lock()
+
+def preload_models(languages=None, whisper=None):
+    """Load spaCy and Whisper models once, then freeze the heap so forked workers share it copy-on-write"""
+    with PRELOAD_LOCK:
+        if MODELS_READY.is_set():
+            return
+        
+        for module_name in HEAVY_MODULES:
+            importlib.import_module(module_name)
+        # langdetect reads its language profiles on the first detection
+        detect_language('warm up the language profiles')
+        
+        load_spacy_models(PRELOAD_LANGUAGES if languages is None else languages)
+        if PRELOAD_WHISPER if whisper is None else whisper:
+            load_whisper_models()
+        
+        # move everything loaded so far out of the collector's generations, so collections
+        # in the workers don't write to (and copy) the pages holding the models
+        gc.collect()
+        gc.freeze()
+        MODELS_READY.set()
+
+def warm_up():
+    """Preload in a background thread, so the server answers requests while the models load"""
+    def run():
+        try:
+            preload_models()
+        except Exception as e:
+            print(f"Warm-up failed: {e}", file=sys.stderr)
+    
+    thread = threading.Thread(target=run, name='quickgloss-warm-up', daemon=True)
+    thread.start()
+    return thread
+
+def create_app(preload=True, background=False, whisper=None):
+    """App factory for WSGI servers, e.g. `gunicorn --preload 'quickGloss:create_app(whisper=False)'`"""
+    if background:
+        warm_up()
+    elif preload:
+        preload_models(whisper=whisper)
+    return app
+
+@app.route('/ready', methods=['GET'])
+def ready():
+    """Readiness probe listing the loaded models; 503 until preloading has finished"""
+    with SPACY_MODELS.lock:
+        loaded = set(SPACY_MODELS.entries)
+    spacy_languages = {lang: SPACY_MODEL_NAMES[lang] in loaded for lang in AVAILABLE_LANGUAGES}
+    status = {
+        'ready': MODELS_READY.is_set(),
+        'spacy_models': sorted(loaded),
+        'spacy_languages': spacy_languages,
+        'missing_spacy_models': sorted(MISSING_SPACY_MODELS),
+        'whisper_models': WHISPER_MODELS_CREATED,
+        'whisper_pool_size': WHISPER_POOL_SIZE,
+        'pid': os.getpid()
+    }
+    return jsonify(status), 200 if status['ready'] else 503
+
+def load_worker_whisper_models(server, worker):
+    """gunicorn post_fork hook: each worker builds its own Whisper pool after the fork"""
+    if PRELOAD_WHISPER:
+        load_whisper_models()
+
+def serve(host=SERVER_HOST, port=SERVER_PORT, workers=SERVER_WORKERS, threads=SERVER_THREADS):
+    """Serve with preforked gunicorn workers that share the preloaded models"""
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        print("gunicorn is not installed, falling back to a single process Flask server", file=sys.stderr)
+        create_app(background=True)
+        app.run(host=host, port=port, threaded=True)
+        return
+    
+    class QuickGlossServer(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', f'{host}:{port}')
+            self.cfg.set('workers', workers)
+            self.cfg.set('threads', threads)
+            self.cfg.set('worker_class', 'gthread')
+            # long transcriptions must not be killed as hung workers
+            self.cfg.set('timeout', 0)
+            self.cfg.set('preload_app', True)
+            self.cfg.set('post_fork', load_worker_whisper_models)
+        
+        def load(self):
+            # preloading blocks here, in the parent, so the forked workers inherit the models;
+            # Whisper is the exception, CTranslate2 threads do not survive a fork
+            return create_app(whisper=False)
+    
+    QuickGlossServer().run()
+
 if __name__ == '__main__':
-    load_spacy_models()
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='QuickGloss server')
+    parser.add_argument('command', nargs='?', choices=['debug', 'serve'], default='debug',
+                        help='debug runs the Flask development server, serve runs preforked production workers')
+    parser.add_argument('--host', default=SERVER_HOST)
+    parser.add_argument('--port', type=int, default=SERVER_PORT)
+    parser.add_argument('--workers', type=int, default=SERVER_WORKERS)
+    parser.add_argument('--threads', type=int, default=SERVER_THREADS)
+    args = parser.parse_args()
+    
+    if args.command == 'serve':
+        serve(args.host, args.port, args.workers, args.threads)
+    else:
+        # with the reloader only the child process serves, so only it warms up
+        create_app(background=os.environ.get('WERKZEUG_RUN_MAIN') == 'true', preload=False)
+        app.run(debug=True, host=args.host, port=args.port)
\ No newline at end of file
@@ -144,24 +144,56 @@ jardín: type=root, meaning=garden`
             `;
         }
         
-        // transcription function
-        async function transcribeText(file) {
+        // transcription function, streams segments to onSegment as they are decoded
+        async function transcribeText(file, onSegment) {
             const formData = new FormData();
             formData.append('file', file);
             
             try {
-                const response = await fetch('/transcribe', {
+                const response = await fetch('/transcribe/stream', {
                     method: 'POST',
                     body: formData
                 });
                 
-                const data = await response.json();
-                
-                if (data.success) {
-                    return data.transcription;
-                } else {
+                const contentType = response.headers.get('Content-Type') || '';
+                if (!contentType.includes('ndjson')) {
+                    // upload errors come back as a plain JSON body
+                    const data = await response.json();
                     throw new Error(data.error || 'Transcription failed');
                 }
+                
+                const reader = response.body.getReader();
+                const decoder = new TextDecoder();
+                let buffer = '';
+                let transcription = '';
+                
+                while (true) {
+                    const { done, value } = await reader.read();
+                    if (done) {
+                        break;
+                    }
+                    
+                    buffer += decoder.decode(value, { stream: true });
+                    const lines = buffer.split('\n');
+                    buffer = lines.pop();
+                    
+                    for (const line of lines) {
+                        if (!line.trim()) {
+                            continue;
+                        }
+                        
+                        const event = JSON.parse(line);
+                        if (event.type === 'segment') {
+                            onSegment(event);
+                        } else if (event.type === 'done') {
+                            transcription = event.transcription;
+                        } else if (event.type === 'error') {
+                            throw new Error(event.error || 'Transcription failed');
+                        }
+                    }
+                }
+                
+                return transcription;
             } catch (error) {
                 throw new Error('Network error: ' + error.message);
             }
@@ -332,7 +364,15 @@ jardín: type=root, meaning=garden`
                         transcribedText.style.display = "block";
                         transcribedText.textContent = "Processing audio... This may take a few minutes.";
                         
-                        const text = await transcribeText(file);
+                        let receivedText = false;
+                        const text = await transcribeText(file, (segment) => {
+                            // replace the loading message with the first decoded segment
+                            if (!receivedText) {
+                                transcribedText.textContent = "";
+                                receivedText = true;
+                            }
+                            transcribedText.textContent += segment.text;
+                        });
                         transcribedText.textContent = text;
                         document.getElementById("port_to_glossing").style.display = "block";
 